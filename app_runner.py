@@ -1,13 +1,31 @@
+import os
+
 import panel as pn
-from assistant.app import AssistantApp
+
+from assistant.shared_state import MEMORY, shared_state_backend
+
+# Callbacks run in a thread pool, so that progress updates reach the browser while a graph is running
+PANEL_NTHREADS = int(os.getenv('PANEL_NTHREADS', '4'))
+
+
+def create_dashboard() -> pn.Column:
+    # Imported within the serving process, so that every forked process opens its own database connections
+    from assistant.app import AssistantApp
+
+    return AssistantApp().get_dashboard()
 
 
 if __name__ == '__main__':
-    # 1) Initialize Panel
-    pn.extension()
+    num_procs = int(os.getenv('PANEL_NUM_PROCS', '1'))
+    if num_procs > 1 and shared_state_backend() == MEMORY:
+        raise SystemExit('PANEL_NUM_PROCS > 1 requires AGENTCRAFT_SHARED_STATE to be sqlite or postgres')
 
-    # 2) Instantiate your custom app
-    app = AssistantApp()
+    # 1) Initialize Panel
+    pn.extension(nthreads=PANEL_NTHREADS)
 
-    # 3) Serve the dashboard
-    pn.serve(app.get_dashboard(), port=5006, allow_websocket_origin=['*'], show=True)
+    # 2) Serve a fresh dashboard to every session, from `num_procs` processes sharing the port
+    pn.serve(create_dashboard, port=5006, allow_websocket_origin=['*'], show=num_procs == 1, num_procs=num_procs)
+elif __name__.startswith('bokeh'):
+    # `panel serve app_runner.py` runs this script once per session
+    pn.extension(nthreads=PANEL_NTHREADS)
+    create_dashboard().servable()
@@ -1,19 +1,37 @@
+import asyncio
 import base64
-from typing import Any, List
+import os
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+from functools import partial
+from typing import Any, Callable, Iterator, List, Optional
 
 import networkx as nx
 import panel as pn
 from langchain_core.messages import HumanMessage
-from langchain_openai import OpenAI
 from langgraph.graph import StateGraph
+from panel.io.callbacks import PeriodicCallback
 from pyvis.network import Network
-from tavily import TavilyClient
 
+from assistant.cassette import use_cassette
+from assistant.citations import citation_registry
 from assistant.inf_graph_analyst_persona import graph as graph_analyst_persona
 from assistant.inf_graph_schema import ResearchGraphState, Analyst
 from assistant.inf_graph_tech_report import graph as graph_tech_report
 from assistant.inf_graph_interview import graph as graph_interview
-from utils.fs_utils import load_api_key
+from assistant.job_queue import (JOB_INTERVIEW, JOB_PERSONAS, JOB_REPORT, STATUS_DONE, STATUS_FAILED, Job,
+                                  create_job_queue)
+from assistant.profiling import profile_run
+from assistant.progress import STATUS_ERROR, STATUS_START, ProgressBus, ProgressEvent, stream_graph
+from assistant.research_store import ResearchRecord, create_research_store
+from assistant.token_budget import RunBudget, TokenBudgetExceeded, use_run_budget
+
+# How often the UI polls the job queue for progress events and results
+JOB_POLL_PERIOD_MS = 1000
+
+MAX_INTERVIEW_TURNS = 2
 
 
 def generate_graph_html(graph: StateGraph) -> pn.pane.HTML:
@@ -44,6 +62,30 @@ def generate_graph_html(graph: StateGraph) -> pn.pane.HTML:
     return pn.pane.HTML(iframe_html, sizing_mode='stretch_both')
 
 
+def session_thread_id() -> str:
+    """
+    Thread id of the browser session, kept in the `thread` query parameter of the URL. A session reconnecting
+    to another serving process or replica, or a reloaded page, thus finds its checkpoints in the shared state.
+    """
+    thread_args = pn.state.session_args.get('thread') if pn.state.curdoc is not None else None
+    if thread_args:
+        return thread_args[0].decode()
+
+    thread_id = uuid.uuid4().hex
+    if pn.state.location is not None:
+        pn.state.location.update_query(thread=thread_id)
+    return thread_id
+
+
+def section_title(section: str) -> str:
+    """Returns the `## ` title of a report section, or its first line."""
+    lines = [line.strip() for line in section.strip().splitlines() if line.strip()]
+    for line in lines:
+        if line.startswith('## '):
+            return line[3:]
+    return lines[0] if lines else ''
+
+
 class ChatFeed(pn.Column):
     """
     A simple chat feed widget that displays conversation messages with scrolling enabled.
@@ -70,25 +112,75 @@ class ChatFeed(pn.Column):
         self.chat_messages.append(msg)
         self.update_feed()
 
+    def clear(self) -> None:
+        """Remove all messages."""
+        self.chat_messages = []
+        self.update_feed()
+
 
 class AssistantApp:
     def __init__(self) -> None:
-        # Initialize API Clients
-        self.llm = OpenAI(api_key=load_api_key('openai.api_key'))
-        self.web_search = TavilyClient(api_key=load_api_key('tavily.api_key'))
-
-        # LLM conversation artifacts
-        self.conversation_thread = {'configurable': {'thread_id': '1'}}
+        # LLM conversation artifacts. Each graph keeps its own thread of the session, as checkpoints may be shared
+        self.session_thread = session_thread_id()
+        self.conversation_thread = {'configurable': {'thread_id': f'{self.session_thread}-personas'}}
+        self.report_thread = {'configurable': {'thread_id': f'{self.session_thread}-report'}}
         self.analyst_personas: list[Analyst] = list()
         self.report_sections: list[str] = list()
+        self.analyst_sections: dict[str, str] = dict()
         self.final_report: str = ''
 
+        # Prior research, offered for reuse when a new question is close to an already researched one
+        self.research_store = create_research_store()
+        self.research_match: Optional[ResearchRecord] = None
+        self.reused_analysts: set[str] = set()
+
+        # When a job queue is configured, graphs run in the worker processes instead of this web process
+        self.job_queue = create_job_queue()
+        self.pending_jobs: dict[int, Callable[[dict[str, Any]], None]] = dict()
+        self.job_event_ids: dict[int, int] = dict()
+        self.job_poller: Optional[PeriodicCallback] = None
+        self.polling_jobs = False
+        self.num_pending_interviews = 0
+        self.num_interviews = 0
+        self.md_job_status = pn.pane.Markdown(sizing_mode='stretch_width')
+
+        # Node-level progress of the graph runs, in-process or in the workers, throttled and coalesced by the bus
+        self.progress_bus = ProgressBus()
+        self.progress_bus.subscribe(self.show_progress)
+        self.running_nodes: dict[tuple[str, str], ProgressEvent] = dict()
+        self.md_progress = pn.pane.Markdown(sizing_mode='stretch_width')
+
+        # Token and cost budget of the research run on the current question, across all its graph runs and jobs
+        self.run_budget = RunBudget()
+        self.md_run_usage = pn.pane.Markdown(sizing_mode='stretch_width')
+
+        # Record / replay of the LLM and search I/O: one cassette per graph run, grouped by the session run
+        self.cassette_run = os.getenv('AGENTCRAFT_CASSETTE_RUN') or datetime.now().strftime('%Y%m%d-%H%M%S')
+        self.graph_runs: dict[str, int] = defaultdict(int)
+
+        # Sampling profiles of the graph runs of this session, or of its jobs, under runs/<session thread>
+        self.cb_profile = pn.widgets.Checkbox(name='Profile graph runs', value=os.getenv('AGENTCRAFT_PROFILE') == '1')
+
         # UI Components for query processing
         self.query_input = pn.widgets.TextInput(name='Enter your question', sizing_mode = 'stretch_width')
         self.query_input.value = 'What compounds have a similar molecular fingerprint to Ibuprofen?'
 
         self.submit_button = pn.widgets.Button(name='Next', button_type='primary')
-        self.submit_button.on_click(self.create_analyst_personas)
+        self.submit_button.on_click(self.submit_query)
+
+        self.md_research_match = pn.pane.Markdown(sizing_mode='stretch_width')
+        self.cbg_reuse_sections = pn.widgets.CheckBoxGroup(name='Sections to reuse', inline=False)
+        self.btn_research_reuse = pn.widgets.Button(name='Reuse selected sections', button_type='primary')
+        self.btn_research_reuse.on_click(self.reuse_research)
+        self.btn_research_fresh = pn.widgets.Button(name='Start fresh', button_type='default')
+        self.btn_research_fresh.on_click(self.create_analyst_personas)
+        self.clmn_research_reuse = pn.Column(
+            self.md_research_match,
+            self.cbg_reuse_sections,
+            pn.Row(self.btn_research_reuse, self.btn_research_fresh),
+            sizing_mode='stretch_width',
+            visible=False
+        )
 
         # -----------------------------
         # Construct Analyst Personas Panel
@@ -189,27 +281,135 @@ class AssistantApp:
         self.dashboard = pn.Column(
             '# Assistant Dashboard',
             self.query_input,
-            self.submit_button,
+            pn.Row(self.submit_button, self.cb_profile),
+            self.clmn_research_reuse,
+            self.md_job_status,
+            self.md_progress,
+            self.md_run_usage,
             pn.layout.Divider(),
             self.accordion
         )
 
+        self.resume_session()
+
+    def resume_session(self) -> None:
+        """Restores the personas and the report of a session that reconnected, possibly to another serving process."""
+        self.analyst_personas = graph_analyst_persona.get_state(self.conversation_thread).values.get('analysts') or []
+        if self.analyst_personas:
+            self.show_analyst_personas()
+
+        self.final_report = graph_tech_report.get_state(self.report_thread).values.get('final_report') or ''
+        if self.final_report:
+            self.chat_report_final.add_message(self.final_report)
+
+    def submit_query(self, event: Any = None) -> None:
+        """Offers to reuse the closest prior research, if any, before constructing the Analyst Personas afresh."""
+        self.start_research_run()
+
+        matches = self.research_store.find_similar(self.query_input.value)
+        if not matches:
+            self.create_analyst_personas(event)
+            return
+
+        self.research_match = matches[0]
+        self.md_research_match.object = (
+            f'Found prior research on **{self.research_match.topic}** '
+            f'(similarity {self.research_match.similarity:.0%}). '
+            f'Select the sections to reuse; the analysts of the other sections will be interviewed again.'
+        )
+        options = {
+            f'{analyst.name}: {section_title(section)}': i
+            for i, (analyst, section) in enumerate(zip(self.research_match.analysts, self.research_match.sections))
+            if section
+        }
+        self.cbg_reuse_sections.options = options
+        self.cbg_reuse_sections.value = list(options.values())
+        self.clmn_research_reuse.visible = True
+
+    def start_research_run(self) -> None:
+        """Drops the sections, report and budget of the previous question, so that none carries over to the new one."""
+        self.research_match = None
+        self.reused_analysts = set()
+        self.report_sections = list()
+        self.analyst_sections = dict()
+        self.final_report = ''
+        self.chat_interview.clear()
+        self.chat_report_sections.clear()
+        self.chat_report_final.clear()
+
+        self.run_budget = RunBudget()
+        self.show_run_usage()
+
+    def reuse_research(self, event: Any = None) -> None:
+        """Takes over the personas of the matched research, together with the selected sections."""
+        self.clmn_research_reuse.visible = False
+        self.accordion.active = [1]
+
+        match = self.research_match
+        citation_registry.update(match.citations)
+        self.analyst_personas = match.analysts
+        self.show_analyst_personas()
+
+        # Let further feedback refine the reused personas
+        graph_analyst_persona.update_state(
+            config=self.conversation_thread,
+            values={
+                'topic': self.ti_analyst_topic.value,
+                'max_analysts': len(match.analysts),
+                'analysts': match.analysts
+            },
+            as_node='create_analysts'
+        )
+
+        self.reused_analysts = set()
+        for i in self.cbg_reuse_sections.value:
+            analyst, section = match.analysts[i], match.sections[i]
+            self.reused_analysts.add(analyst.name)
+            self.add_section(analyst, section)
+
+    def show_analyst_personas(self) -> None:
+        self.clmn_analyst_personas.clear()
+        for analyst in self.analyst_personas:
+            self.clmn_analyst_personas.append(
+                f'Name: {analyst.name} Affiliation: {analyst.affiliation} Role: {analyst.role} Description: {analyst.description}'
+            )
+
+    def add_section(self, analyst: Analyst, section: str) -> None:
+        self.analyst_sections[analyst.name] = section
+        self.report_sections.append(section)
+        rendered_section = citation_registry.render(section)
+        self.chat_report_sections.add_message(rendered_section)
+        self.chat_interview.add_message(rendered_section)
+
     def create_analyst_personas(self, event: Any = None) -> None:
+        self.clmn_research_reuse.visible = False
+        self.reused_analysts = set()
         self.accordion.active = [0]
 
         max_analysts = int(self.ti_analyst_number.value)
         topic = self.ti_analyst_topic.value
-        for event in graph_analyst_persona.stream(input={'topic': topic, 'max_analysts': max_analysts},
-                                                  config=self.conversation_thread,
-                                                  stream_mode='values'):
-            # Review
-            self.analyst_personas = event.get('analysts', [])
-            if self.analyst_personas:
-                self.clmn_analyst_personas.clear()
-                for analyst in self.analyst_personas:
-                    self.clmn_analyst_personas.append(
-                        f'Name: {analyst.name} Affiliation: {analyst.affiliation} Role: {analyst.role} Description: {analyst.description}'
-                    )
+        if self.job_queue is not None:
+            self.submit_job(JOB_PERSONAS, {
+                'topic': topic,
+                'max_analysts': max_analysts,
+                'thread_id': self.conversation_thread['configurable']['thread_id']
+            }, self.on_personas_done)
+            return
+
+        try:
+            with self.graph_run('analyst_personas'):
+                personas = stream_graph(graph_analyst_persona, {'topic': topic, 'max_analysts': max_analysts},
+                                        self.conversation_thread, self.progress_bus, 'analyst_personas')
+        except TokenBudgetExceeded as e:
+            self.show_budget_exceeded('analyst_personas', e)
+            return
+        finally:
+            self.show_run_usage()
+
+        # Review
+        self.analyst_personas = personas.get('analysts', [])
+        if self.analyst_personas:
+            self.show_analyst_personas()
 
     def update_analyst_personas(self, event: Any = None) -> None:
         further_feedack = self.ti_analyst_input.value
@@ -217,6 +417,18 @@ class AssistantApp:
             # set to None if no additional instructions were provided by a user
             further_feedack = None
 
+        if self.job_queue is not None:
+            # Workers are stateless: the personas to refine travel along with the feedback
+            self.ti_analyst_input.value = ''
+            self.submit_job(JOB_PERSONAS, {
+                'topic': self.ti_analyst_topic.value,
+                'max_analysts': int(self.ti_analyst_number.value),
+                'analysts': [analyst.model_dump() for analyst in self.analyst_personas],
+                'human_analyst_feedback': further_feedack,
+                'thread_id': self.conversation_thread['configurable']['thread_id']
+            }, self.on_personas_done)
+            return
+
         graph_analyst_persona.update_state(
             config=self.conversation_thread,
             values={
@@ -238,22 +450,60 @@ class AssistantApp:
         question = self.ti_interview_question.value.format(topic=topic)
         messages = [HumanMessage(question)]
 
-        for i, analyst in enumerate(self.analyst_personas):
-            interview = graph_interview.invoke(
-                {'analyst': analyst, 'messages': messages, 'max_num_turns': 2},
-                config=self.conversation_thread
-            )
-
-            for section in interview.get('sections', []):
-                self.report_sections.append(section)
-                self.chat_report_sections.add_message(section)
-                self.chat_interview.add_message(section)
-
-            # Update progress bar
-            self.pb_interview_progress.value = int(((i + 1) / len(self.analyst_personas)) * 100)
-
-        self.btn_interview_start.disabled = False
-        self.pb_interview_progress.visible = False
+        # Analysts whose sections were reused from prior research need no interview
+        analysts = [analyst for analyst in self.analyst_personas if analyst.name not in self.reused_analysts]
+        if self.job_queue is not None:
+            # One job per analyst, so that the interviews run in parallel across the workers. They share what is
+            # left of the run budget, as none of them reports its usage before it is done
+            self.num_interviews = self.num_pending_interviews = len(analysts)
+            run_budget = self.run_budget.remaining(parts=len(analysts))
+            for analyst in analysts:
+                self.submit_job(JOB_INTERVIEW, {
+                    'analyst': analyst.model_dump(),
+                    'question': question,
+                    'max_num_turns': MAX_INTERVIEW_TURNS
+                }, partial(self.on_interview_done, analyst), run_budget=run_budget)
+            if not analysts:
+                self.on_interview_done(None, {'sections': []})
+            return
+
+        self.num_interviews = self.num_pending_interviews = len(analysts)
+        try:
+            for analyst in analysts:
+                # Each interview runs in its own thread, so that its messages, context and call budget start afresh
+                interview_thread = {'configurable': {'thread_id': f'interview-{uuid.uuid4().hex}'}}
+                with self.graph_run('interview'):
+                    interview = stream_graph(
+                        graph_interview,
+                        {'analyst': analyst, 'messages': messages, 'max_num_turns': MAX_INTERVIEW_TURNS},
+                        interview_thread,
+                        self.progress_bus,
+                        'interview'
+                    )
+                    self.on_interview_done(analyst, interview)
+                    self.show_run_usage()
+
+            if not analysts:
+                self.on_interview_done(None, {'sections': []})
+        except TokenBudgetExceeded as e:
+            # The sections of the interviews done so far are kept
+            self.show_budget_exceeded('interview', e)
+        finally:
+            self.show_run_usage()
+            self.btn_interview_start.disabled = False
+            self.pb_interview_progress.visible = False
+
+    def on_interview_done(self, analyst: Optional[Analyst], result: dict[str, Any]) -> None:
+        citation_registry.update(result.get('citations', {}))
+        for section in result.get('sections', []):
+            self.add_section(analyst, section)
+
+        self.num_pending_interviews = max(self.num_pending_interviews - 1, 0)
+        if self.num_interviews:
+            self.pb_interview_progress.value = int((1 - self.num_pending_interviews / self.num_interviews) * 100)
+        if not self.num_pending_interviews:
+            self.btn_interview_start.disabled = False
+            self.pb_interview_progress.visible = False
 
     def construct_report(self, event: Any = None) -> None:
         self.accordion.active = [2]
@@ -262,6 +512,16 @@ class AssistantApp:
         self.final_report = ''
         self.chat_report_final.clear()
 
+        if self.job_queue is not None:
+            self.submit_job(JOB_REPORT, {
+                'topic': topic,
+                'analysts': [analyst.model_dump() for analyst in self.analyst_personas],
+                'sections': self.report_sections,
+                'citations': citation_registry.export(self.report_sections),
+                'thread_id': self.report_thread['configurable']['thread_id']
+            }, self.on_report_done)
+            return
+
         tech_report_state = ResearchGraphState(
             topic=topic,
             max_analysts=len(self.analyst_personas),
@@ -274,13 +534,152 @@ class AssistantApp:
             final_report=''
         )
 
-        tech_report = graph_tech_report.invoke(tech_report_state, config=self.conversation_thread)
-        self.final_report = tech_report.get('final_report')
+        try:
+            with self.graph_run('tech_report'):
+                tech_report = stream_graph(graph_tech_report, tech_report_state, self.report_thread,
+                                           self.progress_bus, 'tech_report')
+        except TokenBudgetExceeded as e:
+            self.show_budget_exceeded('tech_report', e)
+            return
+        finally:
+            self.show_run_usage()
+        self.on_report_done(tech_report)
+
+    def on_report_done(self, result: dict[str, Any]) -> None:
+        if not result.get('final_report'):
+            return
+        self.final_report = result['final_report']
         self.chat_report_final.add_message(self.final_report)
 
+        # Index the research, so that close variants of the question can reuse its sections
+        self.research_store.save(ResearchRecord(
+            topic=self.query_input.value,
+            analysts=self.analyst_personas,
+            sections=[self.analyst_sections.get(analyst.name, '') for analyst in self.analyst_personas],
+            final_report=self.final_report,
+            citations=citation_registry.export(self.report_sections)
+        ))
+
         print(f'Report: {self.final_report}')
         print('-' * 50)
 
+    def on_personas_done(self, result: dict[str, Any]) -> None:
+        if 'analysts' not in result:
+            return
+        self.analyst_personas = [Analyst(**analyst) for analyst in result['analysts']]
+        self.show_analyst_personas()
+
+    def submit_job(self, kind: str, payload: dict[str, Any], on_done: Callable[[dict[str, Any]], None],
+                   run_budget: Optional[dict[str, Any]] = None) -> None:
+        """
+        Enqueues a graph job for the workers. `on_done` receives its result once the job has finished,
+        or an empty result if the job has failed.
+
+        The job may spend `run_budget`, by default what is left of the run budget; jobs submitted together should
+        split it with `RunBudget.remaining(parts=...)`.
+        """
+        # Workers charge the job to its share of the run budget, and report its usage back with the result
+        self.graph_runs[kind] += 1
+        job_id = self.job_queue.enqueue(kind, {
+            **payload,
+            'run_budget': self.run_budget.remaining() if run_budget is None else run_budget,
+            'profile': self.cb_profile.value,
+            'cassette': f'{self.cassette_run}/{kind}-{self.graph_runs[kind]:03d}'
+        })
+        self.pending_jobs[job_id] = on_done
+        self.job_event_ids[job_id] = 0
+        self.md_job_status.object = f'Job {job_id} ({kind}) queued'
+        if self.job_poller is None:
+            self.job_poller = pn.state.add_periodic_callback(self.poll_jobs, period=JOB_POLL_PERIOD_MS)
+
+    def fetch_job_updates(self, job_event_ids: dict[int, int]) -> list[tuple[Job, list[tuple[int, dict[str, Any]]]]]:
+        """Reads the state and the new progress events of the given jobs from the job queue."""
+        return [
+            (self.job_queue.get(job_id), self.job_queue.events(job_id, after_event_id))
+            for job_id, after_event_id in job_event_ids.items()
+        ]
+
+    async def poll_jobs(self) -> None:
+        """Shows the progress events of the pending jobs, and hands the results of the finished ones over."""
+        # The queries run in a thread, off the event loop serving the sessions; a slow poll skips the next ones
+        if self.polling_jobs:
+            return
+        self.polling_jobs = True
+        try:
+            updates = await asyncio.to_thread(self.fetch_job_updates, dict(self.job_event_ids))
+        finally:
+            self.polling_jobs = False
+
+        for job, events in updates:
+            job_id = job.job_id
+            on_done = self.pending_jobs.get(job_id)
+            if on_done is None:
+                continue
+            if events:
+                self.job_event_ids[job_id] = events[-1][0]
+                self.show_progress([ProgressEvent(**event) for _, event in events])
+
+            # Failed jobs report what they have spent as well
+            if job.status in (STATUS_DONE, STATUS_FAILED) and job.result and 'usage' in job.result:
+                usage = job.result['usage']
+                self.run_budget.record(usage['input_tokens'], usage['output_tokens'], usage['cost'],
+                                       usage.get('cached_tokens', 0))
+                self.show_run_usage()
+            if job.status == STATUS_DONE:
+                del self.pending_jobs[job_id], self.job_event_ids[job_id]
+                self.md_job_status.object = f'Job {job_id} ({job.kind}) done'
+                on_done(job.result)
+            elif job.status == STATUS_FAILED:
+                del self.pending_jobs[job_id], self.job_event_ids[job_id]
+                self.md_job_status.object = f'Job {job_id} ({job.kind}) failed: {job.error.strip().splitlines()[-1]}'
+                on_done(dict())
+
+        if not self.pending_jobs and self.job_poller is not None:
+            self.job_poller.stop()
+            self.job_poller = None
+
+    def show_progress(self, events: list[ProgressEvent]) -> None:
+        """Shows the nodes currently running and, for interviews, advances the progress bar turn by turn."""
+        for event in events:
+            key = (event.graph, event.node)
+            if event.status == STATUS_START:
+                self.running_nodes[key] = event
+            elif not event.node and event.status == STATUS_ERROR:
+                # The graph run failed: none of its nodes is running any longer
+                self.running_nodes = {k: e for k, e in self.running_nodes.items() if k[0] != event.graph}
+            else:
+                self.running_nodes.pop(key, None)
+
+            if event.graph == 'interview' and event.turn and self.num_interviews:
+                num_done = self.num_interviews - self.num_pending_interviews
+                turn_fraction = min(event.turn - 1, MAX_INTERVIEW_TURNS) / (MAX_INTERVIEW_TURNS + 1)
+                self.pb_interview_progress.value = int((num_done + turn_fraction) / self.num_interviews * 100)
+
+        lines = [event.describe() for event in self.running_nodes.values()] or [events[-1].describe()]
+        self.md_progress.object = '\n'.join(f'- {line}' for line in lines)
+
+    def show_run_usage(self) -> None:
+        budget = self.run_budget
+        self.md_run_usage.object = (
+            f'Tokens: {budget.tokens:,} of {budget.max_tokens:,} ({budget.cached_tokens:,} cached) · '
+            f'Cost: ${budget.cost:.4f} of ${budget.max_cost:.2f}'
+        )
+
+    def show_budget_exceeded(self, graph_name: str, error: TokenBudgetExceeded) -> None:
+        self.md_job_status.object = f'`{graph_name}` stopped: {error}'
+
+    @contextmanager
+    def graph_run(self, graph_name: str) -> Iterator[None]:
+        """
+        Context of the next run of the graph, together with the UI updates it triggers: its cassette, named
+        deterministically so that a recorded session replays in order, the run budget and, if enabled, the profiler.
+        """
+        self.graph_runs[graph_name] += 1
+        run_name = f'{graph_name}-{self.graph_runs[graph_name]:03d}'
+        with use_cassette(f'{self.cassette_run}/{run_name}'), use_run_budget(self.run_budget), \
+                profile_run(self.session_thread, run_name, enabled=self.cb_profile.value):
+            yield
+
     def get_dashboard(self) -> pn.Column:
         """Returns the Panel dashboard."""
         return self.dashboard
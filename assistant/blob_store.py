@@ -0,0 +1,141 @@
+import hashlib
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from os import path
+from threading import Lock
+
+from assistant.database import POSTGRES
+from assistant.job_queue import job_queue_backend
+from assistant.shared_state import MEMORY, shared_state_backend
+
+# Blobs kept in memory beyond this size are evicted, least recently used first
+MAX_MEMORY_BLOB_BYTES = int(os.getenv('AGENTCRAFT_MAX_MEMORY_BLOB_MB', '256')) * 1024 * 1024
+# Where the blobs go when several processes share the state of the sessions, unless AGENTCRAFT_BLOB_DIR is set
+DEFAULT_BLOB_DIR = 'blobs'
+
+
+class BlobStore(ABC):
+    """
+    Content-addressed store of text blobs, such as retrieved documents and interview transcripts.
+
+    Blobs are keyed by the SHA-256 of their content, so storing the same document twice costs nothing
+    and graph state only needs to carry the compact blob id.
+    """
+
+    def put(self, content: str) -> str:
+        """Stores the content, if not yet present, and returns its blob id."""
+        blob_id = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        if not self.exists(blob_id):
+            self._write(blob_id, content)
+        return blob_id
+
+    def get(self, blob_id: str) -> str:
+        """Returns the content of the blob. Raises KeyError if the blob is unknown."""
+        return self._read(blob_id)
+
+    @abstractmethod
+    def exists(self, blob_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def _write(self, blob_id: str, content: str) -> None:
+        ...
+
+    @abstractmethod
+    def _read(self, blob_id: str) -> str:
+        ...
+
+
+class MemoryBlobStore(BlobStore):
+    """
+    Keeps the blobs in the process memory, up to `max_bytes` of content. Beyond that the least recently used blobs
+    are evicted, and reading them raises KeyError: graph state still referring to them cannot be resumed.
+    """
+
+    def __init__(self, max_bytes: int = MAX_MEMORY_BLOB_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self._blobs: OrderedDict[str, str] = OrderedDict()
+        self._num_bytes = 0
+        self._lock = Lock()
+
+    def exists(self, blob_id: str) -> bool:
+        with self._lock:
+            if blob_id not in self._blobs:
+                return False
+            self._blobs.move_to_end(blob_id)
+            return True
+
+    def _write(self, blob_id: str, content: str) -> None:
+        with self._lock:
+            if blob_id in self._blobs:
+                return
+            self._blobs[blob_id] = content
+            self._num_bytes += len(content.encode('utf-8'))
+            while self._num_bytes > self.max_bytes and len(self._blobs) > 1:
+                _, evicted = self._blobs.popitem(last=False)
+                self._num_bytes -= len(evicted.encode('utf-8'))
+
+    def _read(self, blob_id: str) -> str:
+        with self._lock:
+            self._blobs.move_to_end(blob_id)
+            return self._blobs[blob_id]
+
+
+class FileBlobStore(BlobStore):
+    """Keeps the blobs as files under `root_dir`, fanned out into sub-directories by the id prefix."""
+
+    def __init__(self, root_dir: str) -> None:
+        self.root_dir = root_dir
+
+    def _path(self, blob_id: str) -> str:
+        return path.join(self.root_dir, blob_id[:2], blob_id)
+
+    def exists(self, blob_id: str) -> bool:
+        return path.exists(self._path(blob_id))
+
+    def _write(self, blob_id: str, content: str) -> None:
+        fqfp_blob = self._path(blob_id)
+        os.makedirs(path.dirname(fqfp_blob), exist_ok=True)
+
+        # Write into a temporary file first, so that concurrent readers never observe a partial blob. The file is
+        # unique to this write, as threads and processes may store the same blob at the same time
+        fd, fqfp_tmp = tempfile.mkstemp(dir=path.dirname(fqfp_blob), prefix=f'{blob_id}.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(content)
+            os.replace(fqfp_tmp, fqfp_blob)
+        except BaseException:
+            if path.exists(fqfp_tmp):
+                os.remove(fqfp_tmp)
+            raise
+
+    def _read(self, blob_id: str) -> str:
+        try:
+            with open(self._path(blob_id), 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            raise KeyError(blob_id)
+
+
+def create_blob_store() -> BlobStore:
+    """
+    Creates a file-backed store under AGENTCRAFT_BLOB_DIR when set. Blobs are referenced from the checkpoints, so
+    when those are shared by several processes the blobs must be too: a single host defaults to `DEFAULT_BLOB_DIR`,
+    while postgres, which may serve several hosts, requires AGENTCRAFT_BLOB_DIR to name a volume they all mount.
+    Otherwise, within a single process, the blobs are kept in memory.
+    """
+    blob_dir = os.getenv('AGENTCRAFT_BLOB_DIR')
+    if blob_dir:
+        return FileBlobStore(blob_dir)
+
+    backends = {shared_state_backend(), job_queue_backend()}
+    if POSTGRES in backends:
+        raise ValueError('AGENTCRAFT_BLOB_DIR must name a directory shared by all hosts of the postgres backends')
+    if backends - {MEMORY, None} or int(os.getenv('PANEL_NUM_PROCS', '1')) > 1:
+        return FileBlobStore(DEFAULT_BLOB_DIR)
+    return MemoryBlobStore()
+
+
+blob_store = create_blob_store()
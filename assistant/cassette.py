@@ -0,0 +1,181 @@
+import gzip
+import hashlib
+import importlib
+import json
+import os
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from os import path
+from threading import Lock
+from typing import Any, Callable, Iterator, Optional
+
+from langchain_core.load import dumpd, load
+from langchain_core.load.serializable import Serializable
+from pydantic import BaseModel
+
+MODE_OFF = 'off'
+MODE_RECORD = 'record'
+MODE_REPLAY = 'replay'
+
+LATENCY_RECORDED = 'recorded'
+LATENCY_INSTANT = 'instant'
+
+# Request fields that differ between otherwise identical runs, such as generated message ids
+VOLATILE_KEYS = {'id', 'run_id'}
+
+
+class CassetteMiss(KeyError):
+    """Raised in replay mode when the cassette holds no recorded response for a request."""
+
+
+def _encode(obj: Any) -> Any:
+    """Converts LangChain objects, pydantic models and containers into JSON-compatible structures."""
+    if isinstance(obj, Serializable) and obj.is_lc_serializable():
+        return {'__lc__': dumpd(obj)}
+    if isinstance(obj, BaseModel):
+        return {'__model__': f'{type(obj).__module__}:{type(obj).__qualname__}', 'data': obj.model_dump(mode='json')}
+    if isinstance(obj, (list, tuple)):
+        return [_encode(item) for item in obj]
+    if isinstance(obj, dict):
+        return {str(key): _encode(value) for key, value in obj.items()}
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    return repr(obj)
+
+
+def _decode(obj: Any) -> Any:
+    """Reverse of `_encode`."""
+    if isinstance(obj, list):
+        return [_decode(item) for item in obj]
+    if isinstance(obj, dict):
+        if '__lc__' in obj:
+            return load(obj['__lc__'])
+        if '__model__' in obj:
+            module_name, class_name = obj['__model__'].split(':')
+            model_class = getattr(importlib.import_module(module_name), class_name)
+            return model_class.model_validate(obj['data'])
+        return {key: _decode(value) for key, value in obj.items()}
+    return obj
+
+
+def _strip_volatile(obj: Any) -> Any:
+    if isinstance(obj, list):
+        return [_strip_volatile(item) for item in obj]
+    if isinstance(obj, dict):
+        return {key: _strip_volatile(value) for key, value in obj.items() if key not in VOLATILE_KEYS}
+    return obj
+
+
+def request_key(kind: str, request: Any) -> str:
+    """Stable key of an encoded request, ignoring volatile fields such as message ids."""
+    normalized = json.dumps([kind, _strip_volatile(request)], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class Cassette:
+    """
+    Recording of the LLM and search requests of a single graph run, together with their responses and latency.
+
+    Cassettes are stored as gzipped JSON lines. In replay mode identical requests are served in the order
+    they were recorded, either after the recorded latency or instantly.
+    """
+
+    def __init__(self, fqfp_cassette: str, mode: str, latency: str = LATENCY_RECORDED) -> None:
+        self.fqfp_cassette = fqfp_cassette
+        self.mode = mode
+        self.latency = latency
+        self.entries: list[dict[str, Any]] = list()
+        self._replay_queue: dict[str, deque] = defaultdict(deque)
+        self._lock = Lock()
+
+        if self.mode == MODE_REPLAY:
+            self.load()
+
+    def load(self) -> None:
+        with gzip.open(self.fqfp_cassette, 'rt', encoding='utf-8') as f:
+            self.entries = [json.loads(line) for line in f if line.strip()]
+        for entry in self.entries:
+            self._replay_queue[entry['key']].append(entry)
+
+    def save(self) -> None:
+        os.makedirs(path.dirname(path.abspath(self.fqfp_cassette)), exist_ok=True)
+        with gzip.open(self.fqfp_cassette, 'wt', encoding='utf-8') as f:
+            for entry in self.entries:
+                f.write(json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n')
+
+    def call(self, kind: str, func: Callable, args: tuple, kwargs: dict) -> Any:
+        """Serves the call from the cassette in replay mode, or performs and records it in record mode."""
+        request = _encode({'args': args, 'kwargs': kwargs})
+        key = request_key(kind, request)
+
+        if self.mode == MODE_REPLAY:
+            with self._lock:
+                queue = self._replay_queue.get(key)
+                if not queue:
+                    raise CassetteMiss(f'No recorded {kind} response for request {key} in {self.fqfp_cassette}')
+                entry = queue.popleft()
+            if self.latency == LATENCY_RECORDED:
+                time.sleep(entry['elapsed'])
+            return _decode(entry['response'])
+
+        started_at = time.perf_counter()
+        response = func(*args, **kwargs)
+        elapsed = time.perf_counter() - started_at
+
+        with self._lock:
+            self.entries.append({
+                'kind': kind,
+                'key': key,
+                'started_at': time.time() - elapsed,
+                'elapsed': round(elapsed, 4),
+                'request': request,
+                'response': _encode(response),
+            })
+        return response
+
+
+current_cassette: ContextVar[Optional[Cassette]] = ContextVar('current_cassette', default=None)
+
+
+@contextmanager
+def use_cassette(name: str, mode: Optional[str] = None, latency: Optional[str] = None) -> Iterator[Optional[Cassette]]:
+    """
+    Records or replays the calls made within the block into the cassette `name`.
+
+    `mode` and `latency` default to AGENTCRAFT_CASSETTE_MODE (off | record | replay) and
+    AGENTCRAFT_CASSETTE_LATENCY (recorded | instant). Cassettes live under AGENTCRAFT_CASSETTE_DIR.
+    """
+    mode = mode or os.getenv('AGENTCRAFT_CASSETTE_MODE', MODE_OFF)
+    latency = latency or os.getenv('AGENTCRAFT_CASSETTE_LATENCY', LATENCY_RECORDED)
+    if mode == MODE_OFF:
+        yield None
+        return
+
+    fqfp_cassette = path.join(os.getenv('AGENTCRAFT_CASSETTE_DIR', 'cassettes'), f'{name}.jsonl.gz')
+    cassette = Cassette(fqfp_cassette, mode, latency)
+    token = current_cassette.set(cassette)
+    try:
+        yield cassette
+    finally:
+        current_cassette.reset(token)
+        if mode == MODE_RECORD:
+            cassette.save()
+
+
+def recorded(kind: str) -> Callable:
+    """Decorator routing the calls of a client function through the current cassette, if any."""
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            cassette = current_cassette.get()
+            if cassette is None:
+                return func(*args, **kwargs)
+            return cassette.call(kind, func, args, kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,137 @@
+import hashlib
+import re
+from threading import Lock
+from typing import Optional
+
+from assistant.shared_state import SharedStore, shared_store
+
+# Bracketed group in the text, such as [S1a2b3c4d5e] or [S1a2b3c4d5e, S6f7a8b9c0d]
+BRACKET_PATTERN = re.compile(r'\[([^\[\]]+)\](?!\()')
+# 40 bits of the SHA-1 of the source: a collision is unlikely well beyond the sources of any deployment
+CITATION_ID_HEX_DIGITS = 10
+CITATION_ID_PATTERN = re.compile(rf'^S[0-9a-f]{{{CITATION_ID_HEX_DIGITS}}}$')
+SOURCES_SECTION_PATTERN = re.compile(r'\n*^#{2,3} Sources\s*$.*', re.MULTILINE | re.DOTALL)
+
+
+def strip_sources(text: str) -> str:
+    """Removes a trailing `## Sources` or `### Sources` section, should the LLM have written one anyway."""
+    return SOURCES_SECTION_PATTERN.sub('', text)
+
+
+class CitationIdConflict(ValueError):
+    """Raised when a citation id is already registered for a different source."""
+
+
+class CitationRegistry:
+    """
+    Session-level registry of the retrieved source documents.
+
+    Every source gets a compact, stable citation id (e.g. S1a2b3c4d5e) when it is fetched. Prompts and LLM outputs
+    carry only these ids, while the numbering and the Sources sections are rebuilt in code when sections
+    and the final report are assembled.
+
+    With a `store`, registrations are written through to the state shared by all serving processes,
+    and ids registered by another process are resolved from it.
+    """
+
+    def __init__(self, store: Optional[SharedStore] = None) -> None:
+        self._labels: dict[str, str] = dict()
+        self._lock = Lock()
+        self.store = store
+
+    def _add(self, citation_id: str, label: str) -> None:
+        """Registers the label under the id. Raises CitationIdConflict if the id stands for another source."""
+        with self._lock:
+            is_new = citation_id not in self._labels
+            registered = self._labels.setdefault(citation_id, label)
+        if is_new and self.store is not None:
+            registered = self.store.put('citations', citation_id, label)
+            if registered != label:
+                with self._lock:
+                    self._labels[citation_id] = registered
+        if registered != label:
+            raise CitationIdConflict(f'Citation id {citation_id} of {label!r} is already taken by {registered!r}')
+
+    def _lookup(self, citation_id: str) -> Optional[str]:
+        label = self._labels.get(citation_id)
+        if label is None and self.store is not None:
+            label = self.store.get('citations', citation_id)
+            if label is not None:
+                with self._lock:
+                    self._labels.setdefault(citation_id, label)
+        return label
+
+    def register(self, source: str, page: str = '') -> str:
+        """Registers the source document and returns its citation id. The id is derived from the source itself."""
+        label = f'{source}, page {page}' if page else source
+        citation_id = 'S' + hashlib.sha1(label.encode('utf-8')).hexdigest()[:CITATION_ID_HEX_DIGITS]
+        self._add(citation_id, label)
+        return citation_id
+
+    def label(self, citation_id: str) -> str:
+        """Returns the human-readable source of the citation id. Raises KeyError if the id is unknown."""
+        label = self._lookup(citation_id)
+        if label is None:
+            raise KeyError(citation_id)
+        return label
+
+    def __contains__(self, citation_id: str) -> bool:
+        return self._lookup(citation_id) is not None
+
+    def cited_ids(self, text: str) -> list[str]:
+        """Registered citation ids referenced by the text, in the order of their first appearance."""
+        cited = dict()
+        for group in BRACKET_PATTERN.findall(text):
+            tokens = [token.strip() for token in group.split(',')]
+            if all(CITATION_ID_PATTERN.match(token) for token in tokens):
+                cited.update((token, None) for token in tokens if token in self)
+        return list(cited)
+
+    def export(self, texts: list[str]) -> dict[str, str]:
+        """Labels of the citations referenced by the texts, e.g. to persist them along with the texts."""
+        return {citation_id: self.label(citation_id) for text in texts for citation_id in self.cited_ids(text)}
+
+    def update(self, labels: dict[str, str]) -> None:
+        """Registers citation ids exported by `export`, e.g. by another process or an earlier session."""
+        for citation_id, label in labels.items():
+            self._add(citation_id, label)
+
+    def renumber(self, text: str) -> tuple[str, list[str]]:
+        """
+        Replaces the citation ids in the text with [1], [2], ... in the order of their first appearance.
+        Ids that were never registered are dropped.
+
+        :returns: the renumbered text and the list of source labels, where label `i` belongs to citation [i + 1]
+        """
+        numbers: dict[str, int] = dict()
+
+        def _replace(match: re.Match) -> str:
+            tokens = [token.strip() for token in match.group(1).split(',')]
+            if not all(CITATION_ID_PATTERN.match(token) for token in tokens):
+                # Not a citation, e.g. a markdown checkbox or a literal bracket
+                return match.group(0)
+
+            replacement = ''
+            for token in tokens:
+                if token not in self:
+                    continue
+                if token not in numbers:
+                    numbers[token] = len(numbers) + 1
+                replacement += f'[{numbers[token]}]'
+            return replacement
+
+        numbered_text = BRACKET_PATTERN.sub(_replace, text)
+        return numbered_text, [self.label(citation_id) for citation_id in numbers]
+
+    def render(self, text: str, sources_header: str = '### Sources') -> str:
+        """Renumbers the citations in the text and appends the matching Sources section."""
+        numbered_text, sources = self.renumber(strip_sources(text))
+        if not sources:
+            return numbered_text
+
+        # Two trailing spaces make a line break in Markdown
+        sources_lines = '\n'.join(f'[{i}] {label}  ' for i, label in enumerate(sources, start=1))
+        return f'{numbered_text.rstrip()}\n\n{sources_header}\n{sources_lines}'
+
+
+citation_registry = CitationRegistry(shared_store)
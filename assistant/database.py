@@ -1,7 +1,14 @@
 import os
+import sqlite3
+from contextlib import closing, contextmanager
+from threading import Lock
+from typing import Any, Callable, Iterator
 
 import psycopg2
 
+POSTGRES = 'postgres'
+SQLITE = 'sqlite'
+
 
 def get_db_connection():
     """Establishes a PostgreSQL database connection."""
@@ -12,3 +19,78 @@ def get_db_connection():
         host=os.getenv('DB_HOST', 'localhost'),
         port=os.getenv('DB_PORT', '5432')
     )
+
+
+def get_db_conninfo() -> str:
+    """Connection string of the PostgreSQL database, for clients other than psycopg2."""
+    return ' '.join([
+        f"dbname={os.getenv('DB_NAME')}",
+        f"user={os.getenv('DB_USER')}",
+        f"password={os.getenv('DB_PASSWORD')}",
+        f"host={os.getenv('DB_HOST', 'localhost')}",
+        f"port={os.getenv('DB_PORT', '5432')}",
+    ])
+
+
+def sqlite_connection_factory(fqfp_db: str) -> Callable[[], sqlite3.Connection]:
+    """Connection factory of a local SQLite file, the stand-in for PostgreSQL in local runs and tests."""
+    return lambda: sqlite3.connect(fqfp_db, timeout=30)
+
+
+class SqlStore:
+    """
+    Base of the stores kept in PostgreSQL or, locally, in SQLite.
+
+    Statements use `?` placeholders, translated for PostgreSQL. Tables are created on first use
+    from the `ddl` of the store's dialect.
+    """
+
+    ddl: dict[str, list[str]] = dict()
+
+    def __init__(self, connect: Callable[[], Any], dialect: str) -> None:
+        self.connect = connect
+        self.dialect = dialect
+        self._initialized = False
+        self._lock = Lock()
+
+    def _initialize(self) -> None:
+        with self._lock:
+            if self._initialized:
+                return
+            with closing(self.connect()) as conn:
+                with conn:
+                    with closing(conn.cursor()) as cursor:
+                        for ddl in self.ddl[self.dialect]:
+                            cursor.execute(ddl)
+            self._initialized = True
+
+    def sql(self, statement: str) -> str:
+        return statement if self.dialect == SQLITE else statement.replace('?', '%s')
+
+    @contextmanager
+    def transaction(self) -> Iterator[Any]:
+        """Cursor within a transaction, committed on success. SQLite transactions take the write lock upfront."""
+        self._initialize()
+        with closing(self.connect()) as conn:
+            if self.dialect == SQLITE:
+                conn.isolation_level = None
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    with closing(conn.cursor()) as cursor:
+                        yield cursor
+                    conn.execute('COMMIT')
+                except BaseException:
+                    conn.execute('ROLLBACK')
+                    raise
+            else:
+                with conn:
+                    with closing(conn.cursor()) as cursor:
+                        yield cursor
+
+    def execute(self, statement: str, params: tuple = ()) -> list[tuple]:
+        """Executes a single statement in its own transaction and returns the fetched rows, if any."""
+        with self.transaction() as cursor:
+            cursor.execute(self.sql(statement), params)
+            if cursor.description is None:
+                return []
+            return cursor.fetchall()
@@ -0,0 +1,147 @@
+import hashlib
+import os
+import random
+import re
+import time
+from typing import Any, Type
+
+from langchain_core.documents import Document
+from langchain_core.messages import AIMessage, convert_to_messages
+from pydantic import BaseModel
+
+from assistant.inf_graph_schema import Analyst, Perspectives, SearchQuery
+
+# Mean latency of a fake LLM or search call, to stand in for the network wait of the real backends
+FAKE_LATENCY_SECONDS = float(os.getenv('AGENTCRAFT_FAKE_LATENCY', '0.2'))
+FAKE_DOCUMENT_WORDS = 300
+FAKE_ANSWER_WORDS = 150
+
+CITATION_ID_PATTERN = re.compile(r'<Document id="(S[0-9a-f]+)"')
+REQUESTED_PERSONAS_PATTERN = re.compile(r'set of (\d+) Analyst Personas')
+
+WORDS = [
+    'assay', 'binding', 'biomarker', 'candidate', 'cohort', 'compound', 'dataset', 'dosage', 'efficacy', 'enzyme',
+    'fingerprint', 'genome', 'inhibitor', 'kinetics', 'ligand', 'metabolite', 'model', 'molecule', 'pathway',
+    'phenotype', 'pipeline', 'protein', 'receptor', 'regulation', 'response', 'safety', 'scaffold', 'screening',
+    'selectivity', 'sequence', 'signal', 'solubility', 'structure', 'synthesis', 'target', 'toxicity', 'trial',
+    'validation', 'variant', 'yield',
+]
+
+
+def fake_backends_enabled() -> bool:
+    """Whether AGENTCRAFT_FAKE_BACKENDS replaces the LLM and search clients with canned, offline fakes."""
+    return os.getenv('AGENTCRAFT_FAKE_BACKENDS', '0') == '1'
+
+
+def _simulate_latency() -> None:
+    time.sleep(random.uniform(0.5, 1.5) * FAKE_LATENCY_SECONDS)
+
+
+def _rng(text: str) -> random.Random:
+    """Random generator seeded by the text, so that the same request always gets the same response."""
+    return random.Random(hashlib.sha256(text.encode('utf-8')).hexdigest())
+
+
+def _words(rng: random.Random, count: int) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def _paragraphs(rng: random.Random, count: int, citations: list[str]) -> str:
+    """Sentences of random words, each citing one of the source ids, if any."""
+    sentences = list()
+    for _ in range(count // 12):
+        citation = f' [{rng.choice(citations)}]' if citations else ''
+        sentences.append(f'{_words(rng, 12).capitalize()}{citation}.')
+    return ' '.join(sentences)
+
+
+class FakeChatModel:
+    """Stand-in of the OpenAI chat model: markdown shaped after the task of the prompt, with the usual citations."""
+
+    def invoke(self, messages: Any, *args, **kwargs) -> AIMessage:
+        messages = convert_to_messages(messages if isinstance(messages, list) else [messages])
+        prompt = '\n\n'.join(str(message.content) for message in messages)
+        task = str(messages[-1].content).lower()
+        rng = _rng(prompt)
+        citations = CITATION_ID_PATTERN.findall(prompt)
+        body = _paragraphs(rng, FAKE_ANSWER_WORDS, citations)
+
+        if 'introduction' in task:
+            content = f'# {_words(rng, 4).title()}\n\n## Introduction\n\n{body}'
+        elif 'conclusion' in task:
+            content = f'## Conclusion\n\n{body}'
+        elif 'report based upon' in task:
+            content = f'## Insights\n\n{body}'
+        elif 'write your section' in task:
+            content = f'## {_words(rng, 4).title()}\n\n### Summary\n\n{body}'
+        else:
+            content = body
+
+        _simulate_latency()
+        return AIMessage(content=content, usage_metadata={
+            'input_tokens': len(prompt) // 4,
+            'output_tokens': len(content) // 4,
+            'total_tokens': (len(prompt) + len(content)) // 4,
+        })
+
+    def with_structured_output(self, schema: Type[BaseModel]) -> 'FakeStructuredModel':
+        return FakeStructuredModel(schema)
+
+
+class FakeStructuredModel:
+    """Stand-in of a chat model with structured output, for the schemas the graphs request."""
+
+    def __init__(self, schema: Type[BaseModel]) -> None:
+        self.schema = schema
+
+    def invoke(self, messages: Any, *args, **kwargs) -> BaseModel:
+        messages = convert_to_messages(messages if isinstance(messages, list) else [messages])
+        prompt = '\n\n'.join(str(message.content) for message in messages)
+        rng = _rng(prompt)
+        _simulate_latency()
+
+        if self.schema is SearchQuery:
+            return SearchQuery(search_query=_words(rng, 6))
+        if self.schema is Perspectives:
+            match = REQUESTED_PERSONAS_PATTERN.search(prompt)
+            return Perspectives(analysts=[
+                Analyst(
+                    affiliation=f'{_words(rng, 2).title()} Institute',
+                    name=f'Dr. {_words(rng, 1).title()} {rng.randrange(10_000)}',
+                    role=f'{_words(rng, 2).title()} Analyst',
+                    description=_words(rng, 20)
+                )
+                for _ in range(int(match.group(1)) if match else 1)
+            ])
+        raise NotImplementedError(f'No fake structured output for {self.schema.__name__}')
+
+
+class FakeTavilySearch:
+    """Stand-in of the Tavily search tool."""
+
+    def invoke(self, query: str) -> list[dict]:
+        rng = _rng(query)
+        _simulate_latency()
+        return [
+            {'url': f'https://example.com/{rng.randrange(1_000_000)}', 'content': _words(rng, FAKE_DOCUMENT_WORDS)}
+            for _ in range(3)
+        ]
+
+
+class FakeWikipediaLoader:
+    """Stand-in of the Wikipedia document loader."""
+
+    def __init__(self, query: str, load_max_docs: int = 2) -> None:
+        self.query = query
+        self.load_max_docs = load_max_docs
+
+    def load(self) -> list[Document]:
+        rng = _rng(self.query)
+        _simulate_latency()
+        return [
+            Document(
+                page_content=_words(rng, FAKE_DOCUMENT_WORDS),
+                metadata={'source': f'https://en.wikipedia.org/wiki/{_words(rng, 2).title().replace(" ", "_")}'}
+            )
+            for _ in range(self.load_max_docs)
+        ]
@@ -1,26 +1,9 @@
-from langchain_core.messages import HumanMessage, SystemMessage
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import START, END, StateGraph
 
 from assistant.inf_graph_schema import GenerateAnalystsState, Analyst
-from assistant.services import safe_invoke_perspective
-
-INSTRUCTIONS_CREATE_ANALYST_PERSONAS = """
-You are tasked with creating a set of Analyst Personas. Follow these instructions carefully:
-                    
-1. First, review the research topic: {topic}
-                    
-2. Examine any editorial feedback that has been optionally provided to guide creation of the Analyst Personas:
-                    
-{human_analyst_feedback}
-                    
-
-3. Determine the most interesting themes based upon documents and / or feedback above.
-                    
-4. Pick the top {max_analysts} themes.
-                    
-5. Assign one analyst to each theme.
-"""
+from assistant.persona_engine import fill_personas, refine_personas
+from assistant.profiling import profiled
+from assistant.shared_state import create_checkpointer
 
 
 def create_analysts(state: GenerateAnalystsState) -> dict[str, list[Analyst]]:
@@ -29,19 +12,19 @@ def create_analysts(state: GenerateAnalystsState) -> dict[str, list[Analyst]]:
     topic = state['topic']
     max_analysts = state['max_analysts']
     human_analyst_feedback = state.get('human_analyst_feedback', '')
+    analysts = state.get('analysts') or []
 
-    # System message
-    system_message = INSTRUCTIONS_CREATE_ANALYST_PERSONAS.format(
-        topic=topic, human_analyst_feedback=human_analyst_feedback, max_analysts=max_analysts
-    )
+    # Refine only the personas affected by the feedback, keeping the rest of the set
+    if human_analyst_feedback and analysts:
+        analysts = refine_personas(topic, analysts, max_analysts, human_analyst_feedback)
+        # Feedback has been applied; clear it so that it is not applied again on the next run
+        return {'analysts': analysts, 'human_analyst_feedback': None}
 
-    # Generate question
-    analysts = safe_invoke_perspective(
-        [SystemMessage(content=system_message)] + [HumanMessage(content='Generate the set of Analyst Personas.')]
-    )
+    # Generate the set of personas in parallel batches
+    analysts = fill_personas(topic, [], max_analysts, human_analyst_feedback)
 
     # Write the list of analysis to state
-    return {'analysts': analysts.analysts}
+    return {'analysts': analysts}
 
 
 def human_feedback(state: GenerateAnalystsState) -> None:
@@ -64,13 +47,13 @@ def should_continue(state: GenerateAnalystsState) -> str:
 def build_graph() -> StateGraph:
     # Add nodes and edges
     builder = StateGraph(GenerateAnalystsState)
-    builder.add_node('create_analysts', create_analysts)
-    builder.add_node('human_feedback', human_feedback)
+    builder.add_node('create_analysts', profiled(create_analysts))
+    builder.add_node('human_feedback', profiled(human_feedback))
     builder.add_edge(START, 'create_analysts')
     builder.add_edge('create_analysts', 'human_feedback')
     builder.add_conditional_edges('human_feedback', should_continue, ['create_analysts', END])
     return builder
 
 
-memory = MemorySaver()
+memory = create_checkpointer()
 graph = build_graph().compile(interrupt_before=['human_feedback'], checkpointer=memory)
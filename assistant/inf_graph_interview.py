@@ -1,13 +1,24 @@
 from typing import Literal, Any
 
-from langchain_community.document_loaders import WikipediaLoader
-from langchain_core.messages import get_buffer_string, SystemMessage, AIMessage, HumanMessage
-from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.messages import get_buffer_string, AIMessage
 from langgraph.constants import START, END
 from langgraph.graph import StateGraph
 
-from assistant.inf_graph_schema import InterviewState
-from assistant.services import safe_invoke, tavily_search, structured_searchquery_llm
+from assistant.blob_store import blob_store
+from assistant.citations import citation_registry, strip_sources
+from assistant.inf_graph_schema import InterviewState, DocumentRef
+from assistant.prompt_assembly import assemble_prompt, prompt_part
+from assistant.profiling import profiled
+from assistant.services import safe_invoke, invoke_searchquery, search_tavily, load_wikipedia
+from assistant.shared_state import create_checkpointer
+from assistant.text_similarity import extract_sources, ngrams, novelty
+
+# Every question - answer turn costs: question, two search queries, answer
+LLM_CALLS_PER_TURN = 4
+# Turns the interview may run past `max_num_turns` while the information gain stays high
+MAX_EXTRA_TURNS = 2
+MIN_INFORMATION_GAIN = 0.15
+EXTEND_INFORMATION_GAIN = 0.6
 
 INSTRUCTIONS_ANALYST_INTERVIEWS_EXPERT = """You are an analyst tasked with interviewing an expert to learn about a specific topic. 
 
@@ -17,7 +28,7 @@ Your goal is boil down to interesting and specific insights related to your topi
         
 2. Specific: Insights that avoid generalities and include specific examples from the expert.
 
-Here is your topic of focus and set of goals: {goals}
+Your topic of focus and set of goals follow these instructions.
         
 Begin by introducing yourself using a name that fits your persona, and then ask your question.
 
@@ -36,15 +47,18 @@ def generate_question(state: InterviewState):
     messages = state['messages']
 
     # Generate question
-    system_message = INSTRUCTIONS_ANALYST_INTERVIEWS_EXPERT.format(goals=analyst.persona)
-    question = safe_invoke([SystemMessage(content=system_message)] + messages)
+    question = safe_invoke(assemble_prompt(
+        INSTRUCTIONS_ANALYST_INTERVIEWS_EXPERT,
+        prompt_part('Your topic of focus and set of goals', analyst.persona),
+        messages=messages
+    ))
 
     # Write messages to state
-    return {'messages': [question]}
+    return {'messages': [question], 'llm_calls': 1}
 
 
 # Search query writing
-INSTRUCTIONS_COMPOSE_SEARCH_QUERY = SystemMessage(content=f"""You will be given a conversation between an Analyst and an Expert.
+INSTRUCTIONS_COMPOSE_SEARCH_QUERY = """You will be given a conversation between an Analyst and an Expert.
 
 Your goal is to generate a well-structured query for use in retrieval and / or web-search related to the conversation.
         
@@ -52,58 +66,75 @@ First, analyze the full conversation.
 
 Pay particular attention to the final question posed by the analyst.
 
-Convert this final question into a well-structured web search query""")
+Convert this final question into a well-structured web search query"""
 
 
-def search_web(state: InterviewState) -> dict[str, list[str]]:
+def format_documents(context: list[DocumentRef]) -> str:
+    """ Resolve the document references from the blob store and format them for a prompt """
+
+    formatted_docs = list()
+    seen_blob_ids = set()
+    for ref in context:
+        # The same document may have been retrieved on several turns
+        if ref.blob_id in seen_blob_ids:
+            continue
+        seen_blob_ids.add(ref.blob_id)
+
+        content = blob_store.get(ref.blob_id)
+        formatted_docs.append(f'<Document id="{ref.citation_id}"/>\n{content}\n</Document>')
+    return "\n\n---\n\n".join(formatted_docs)
+
+
+def search_web(state: InterviewState) -> dict[str, Any]:
     """ Retrieve docs from web search """
 
     # Search query
-    search_query = structured_searchquery_llm.invoke([INSTRUCTIONS_COMPOSE_SEARCH_QUERY] + state['messages'])
+    search_query = invoke_searchquery(assemble_prompt(INSTRUCTIONS_COMPOSE_SEARCH_QUERY, messages=state['messages']))
 
     # Search
-    search_docs = tavily_search.invoke(search_query.search_query)
-
-    # Format
-    formatted_search_docs = "\n\n---\n\n".join(
-        [
-            f'<Document href="{doc["url"]}"/>\n{doc["content"]}\n</Document>'
-            for doc in search_docs
-        ]
-    )
+    search_docs = search_tavily(search_query.search_query)
+
+    # Store the documents and keep only their references in the state
+    search_refs = [
+        DocumentRef(
+            blob_id=blob_store.put(doc['content']),
+            citation_id=citation_registry.register(doc['url']),
+            source=doc['url']
+        )
+        for doc in search_docs
+    ]
 
-    return {'context': [formatted_search_docs]}
+    return {'context': search_refs, 'llm_calls': 1}
 
 
-def search_wikipedia(state: InterviewState) -> dict[str, list[str]]:
+def search_wikipedia(state: InterviewState) -> dict[str, Any]:
     """ Retrieve docs from wikipedia """
 
     # Search query
-    search_query = structured_searchquery_llm.invoke([INSTRUCTIONS_COMPOSE_SEARCH_QUERY] + state['messages'])
+    search_query = invoke_searchquery(assemble_prompt(INSTRUCTIONS_COMPOSE_SEARCH_QUERY, messages=state['messages']))
 
     # Search
-    search_docs = WikipediaLoader(query=search_query.search_query, load_max_docs=2).load()
-
-    # Format
-    formatted_search_docs = "\n\n---\n\n".join(
-        [
-            f'<Document source="{doc.metadata["source"]}" page="{doc.metadata.get("page", "")}"/>\n{doc.page_content}\n</Document>'
-            for doc in search_docs
-        ]
-    )
+    search_docs = load_wikipedia(search_query.search_query, load_max_docs=2)
 
-    return {'context': [formatted_search_docs]}
+    # Store the documents and keep only their references in the state
+    search_refs = [
+        DocumentRef(
+            blob_id=blob_store.put(doc.page_content),
+            citation_id=citation_registry.register(doc.metadata['source'], str(doc.metadata.get('page', ''))),
+            source=doc.metadata['source'],
+            page=str(doc.metadata.get('page', ''))
+        )
+        for doc in search_docs
+    ]
 
+    return {'context': search_refs, 'llm_calls': 1}
 
-INSTRUCTIONS_EXPERT_ANSWER = """You are an Expert being interviewed by an Analyst.
 
-Here is analyst area of focus: {goals}. 
-        
-You goal is to answer a question posed by the interviewer.
+INSTRUCTIONS_EXPERT_ANSWER = """You are an Expert being interviewed by an Analyst.
 
-To answer question, use this context:
+The area of focus of the analyst and the context follow these instructions.
         
-{context}
+You goal is to answer a question posed by the interviewer, using the context.
 
 When answering questions, follow these guidelines:
         
@@ -111,36 +142,59 @@ When answering questions, follow these guidelines:
         
 2. Do not introduce external information or make assumptions beyond what is explicitly stated in the context.
 
-3. The context contain sources at the topic of each individual document.
+3. Each document in the context starts with its source id, for example: <Document id="S1a2b3c4d5e"/>
 
-4. Include these sources your answer next to any relevant statements. For example, for source # 1 use [1]. 
+4. Cite the sources in your answer next to any relevant statements, using the source id in brackets. For example: [S1a2b3c4d5e]
 
-5. List your sources in order at the bottom of your answer. [1] Source 1, [2] Source 2, etc
-        
-6. If the source is: <Document source="assistant/docs/llama3_1.pdf" page="7"/>' then just list: 
-        
-[1] assistant/docs/llama3_1.pdf, page 7 
-        
-And skip the addition of the brackets as well as the Document source preamble in your citation."""
+5. Do not list the sources at the bottom of your answer."""
+
+
+def measure_information_gain(new_texts: list[str], seen_texts: list[str]) -> float:
+    """
+    Cheap local novelty signal of a turn: the share of new source documents and of new word trigrams
+    in `new_texts` compared with `seen_texts`. Returns a value between 0.0 (nothing new) and 1.0.
+    """
+    new_text = '\n'.join(new_texts)
+    seen_text = '\n'.join(seen_texts)
 
+    signals = [novelty(ngrams(new_text), ngrams(seen_text))]
+    new_sources = extract_sources(new_text)
+    if new_sources:
+        signals.append(novelty(new_sources, extract_sources(seen_text)))
+    return sum(signals) / len(signals)
 
-def generate_answer(state: InterviewState) -> dict[str, list[dict[str, Any]]]:
+
+def generate_answer(state: InterviewState) -> dict[str, Any]:
     """ Node to answer a question """
 
     # Get state
     analyst = state['analyst']
     messages = state['messages']
     context = state['context']
-
-    # Answer question
-    system_message = INSTRUCTIONS_EXPERT_ANSWER.format(goals=analyst.persona, context=context)
-    answer = safe_invoke([SystemMessage(content=system_message)] + messages)
+    context_seen = state.get('context_seen', 0)
+
+    # Answer question. The context goes before the conversation: it only grows at its end between turns, so the
+    # instructions and the documents of the previous turn stay a cached prefix. The previous turn's conversation
+    # follows the new documents and is sent afresh, which costs less than resending the far larger context
+    answer = safe_invoke(assemble_prompt(
+        INSTRUCTIONS_EXPERT_ANSWER,
+        prompt_part('Analyst area of focus', analyst.persona),
+        prompt_part('Context', format_documents(context)),
+        messages=messages
+    ))
 
     # Name the message as coming from the expert
     answer.name = 'expert'
 
+    # Score the context fetched this turn and the answer against everything seen in the previous turns
+    previous_answers = [m.content for m in messages if isinstance(m, AIMessage) and m.name == 'expert']
+    gain = measure_information_gain(
+        new_texts=[format_documents(context[context_seen:]), answer.content],
+        seen_texts=[format_documents(context[:context_seen])] + previous_answers
+    )
+
     # Append it to state
-    return {'messages': [answer]}
+    return {'messages': [answer], 'information_gain': [gain], 'context_seen': len(context), 'llm_calls': 1}
 
 
 def save_interview(state: InterviewState) -> dict[str, str]:
@@ -149,10 +203,10 @@ def save_interview(state: InterviewState) -> dict[str, str]:
     # Get messages
     messages = state['messages']
 
-    # Convert interview to a string
-    interview = get_buffer_string(messages)
+    # Convert interview to a string and keep it in the blob store
+    interview = blob_store.put(get_buffer_string(messages))
 
-    # Save to interviews key
+    # Save the transcript blob id to interviews key
     return {'interview': interview}
 
 
@@ -162,14 +216,27 @@ def route_messages(state: InterviewState, name: str = 'expert') -> Literal['save
     # Get messages
     messages = state['messages']
     max_num_turns = state.get('max_num_turns', 2)
+    information_gain = state.get('information_gain', [])
+    min_information_gain = state.get('min_information_gain', MIN_INFORMATION_GAIN)
+    extend_information_gain = state.get('extend_information_gain', EXTEND_INFORMATION_GAIN)
+    max_llm_calls = state.get('max_llm_calls', (max_num_turns + MAX_EXTRA_TURNS) * LLM_CALLS_PER_TURN + 1)
 
     # Check the number of expert answers
     num_responses = len(
         [m for m in messages if isinstance(m, AIMessage) and m.name == name]
     )
 
-    # End if expert has answered more than the max turns
-    if num_responses >= max_num_turns:
+    # End if another turn, plus the section writer, would exceed the call budget
+    if state.get('llm_calls', 0) + LLM_CALLS_PER_TURN + 1 > max_llm_calls:
+        return 'save_interview'
+
+    # End early if the last turn surfaced mostly already-seen sources and content
+    last_gain = information_gain[-1] if information_gain else 1.0
+    if last_gain < min_information_gain:
+        return 'save_interview'
+
+    # End if expert has answered more than the max turns, unless the last turn was still highly informative
+    if num_responses >= max_num_turns and last_gain < extend_information_gain:
         return 'save_interview'
 
     # This router is run after each question - answer pair
@@ -186,7 +253,7 @@ INSTRUCTION_SECTION_WRITER = """You are an expert Technical Writer.
 Your task is to create a short, easily digestible section of a report based on a set of source documents.
 
 1. Analyze the content of the source documents: 
-- The name of each source document is at the start of the document, with the <Document tag.
+- The id of each source document is at the start of the document, with the <Document tag.
         
 2. Create a report structure using markdown formatting:
 - Use ## for the section title
@@ -195,45 +262,25 @@ Your task is to create a short, easily digestible section of a report based on a
 3. Write the report following this structure:
 a. Title (## header)
 b. Summary (### header)
-c. Sources (### header)
 
-4. Make your title engaging based upon the focus area of the analyst: 
-{focus}
+4. Make your title engaging based upon the focus area of the analyst, which follows these instructions.
 
 5. For the summary section:
 - Set up summary with general background / context related to the focus area of the analyst
 - Emphasize what is novel, interesting, or surprising about insights gathered from the interview
-- Create a numbered list of source documents, as you use them
 - Do not mention the names of interviewers or experts
 - Aim for approximately 400 words maximum
-- Use numbered sources in your report (e.g., [1], [2]) based on information from source documents
+- Cite the source documents by their id in brackets (e.g., [S1a2b3c4d5e]) next to statements based on them
         
-6. In the Sources section:
-- Include all sources used in your report
-- Provide full links to relevant websites or specific document paths
-- Separate each source by a newline. Use two spaces at the end of each line to create a newline in Markdown.
-- It will look like:
-
-### Sources
-[1] Link or Document name
-[2] Link or Document name
-
-7. Be sure to combine sources. For example this is not correct:
-
-[3] https://ai.meta.com/blog/meta-llama-3-1/
-[4] https://ai.meta.com/blog/meta-llama-3-1/
-
-There should be no redundant sources. It should simply be:
-
-[3] https://ai.meta.com/blog/meta-llama-3-1/
+6. Do not write a Sources section; it is appended automatically.
         
-8. Final review:
+7. Final review:
 - Ensure the report follows the required structure
 - Include no preamble before the title of the report
 - Check that all guidelines have been followed"""
 
 
-def write_section(state: InterviewState) -> dict[str, list[str]]:
+def write_section(state: InterviewState) -> dict[str, Any]:
     """ Node to answer a question """
 
     # Get state
@@ -242,25 +289,25 @@ def write_section(state: InterviewState) -> dict[str, list[str]]:
     analyst = state['analyst']
 
     # Write section using either the gathered source docs from interview (context) or the interview itself (interview)
-    system_message = INSTRUCTION_SECTION_WRITER.format(focus=analyst.description)
-    section = safe_invoke(
-        [SystemMessage(content=system_message)] + [
-            HumanMessage(content=f'Use this source to write your section: {context}')]
-    )
+    section = safe_invoke(assemble_prompt(
+        INSTRUCTION_SECTION_WRITER,
+        prompt_part('Focus area of the analyst', analyst.description),
+        task=f'Use this source to write your section: {format_documents(context)}'
+    ))
 
-    # Append it to state
-    return {'sections': [section.content]}
+    # Append it to state. Citations stay as source ids, to be numbered when the section or report is rendered
+    return {'sections': [strip_sources(section.content)], 'llm_calls': 1}
 
 
 def build_graph() -> StateGraph:
     # Add nodes and edges
     interview_builder = StateGraph(InterviewState)
-    interview_builder.add_node('ask_question', generate_question)
-    interview_builder.add_node('search_web', search_web)
-    interview_builder.add_node('search_wikipedia', search_wikipedia)
-    interview_builder.add_node('answer_question', generate_answer)
-    interview_builder.add_node('save_interview', save_interview)
-    interview_builder.add_node('write_section', write_section)
+    interview_builder.add_node('ask_question', profiled(generate_question))
+    interview_builder.add_node('search_web', profiled(search_web))
+    interview_builder.add_node('search_wikipedia', profiled(search_wikipedia))
+    interview_builder.add_node('answer_question', profiled(generate_answer))
+    interview_builder.add_node('save_interview', profiled(save_interview))
+    interview_builder.add_node('write_section', profiled(write_section))
 
     # Flow
     interview_builder.add_edge(START, 'ask_question')
@@ -276,5 +323,5 @@ def build_graph() -> StateGraph:
 
 
 # Interview
-memory = MemorySaver()
+memory = create_checkpointer()
 graph = build_graph().compile(checkpointer=memory).with_config(run_name='Conduct Interviews')
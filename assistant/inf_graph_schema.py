@@ -31,6 +31,22 @@ class Perspectives(BaseModel):
     )
 
 
+class DocumentRef(BaseModel):
+    blob_id: str = Field(
+        description='Id of the document content in the blob store.'
+    )
+    citation_id: str = Field(
+        description='Stable id of the source document in the citation registry.'
+    )
+    source: str = Field(
+        description='URL or path of the source document.'
+    )
+    page: str = Field(
+        default='',
+        description='Page of the source document, if applicable.'
+    )
+
+
 class GenerateAnalystsState(TypedDict):
     topic: str  # Topic of the research
     max_analysts: int  # Number of analysts
@@ -40,10 +56,16 @@ class GenerateAnalystsState(TypedDict):
 
 class InterviewState(MessagesState):
     max_num_turns: int  # Number turns of conversation
-    context: Annotated[list, operator.add]  # Source docs
+    context: Annotated[List[DocumentRef], operator.add]  # References to source docs in the blob store
     analyst: Analyst  # Analyst asking questions
-    interview: str  # Interview transcript
+    interview: str  # Blob id of the interview transcript
     sections: list  # Final key we duplicate in outer state for Send() API
+    information_gain: Annotated[list, operator.add]  # Per-turn novelty of the fetched context and expert answer
+    context_seen: int  # Number of context entries already scored for information gain
+    llm_calls: Annotated[int, operator.add]  # Number of LLM calls spent by the interview
+    min_information_gain: float  # End the interview once a turn brings less novelty than this
+    extend_information_gain: float  # Continue past max_num_turns while a turn brings at least this novelty
+    max_llm_calls: int  # Per-interview budget of LLM calls
 
 
 class SearchQuery(BaseModel):
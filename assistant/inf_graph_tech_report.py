@@ -1,18 +1,19 @@
 from typing import Any
 
-from langchain_core.messages import HumanMessage, SystemMessage
-from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.messages import BaseMessage
 from langgraph.constants import Send, START, END
 from langgraph.graph import StateGraph
 
+from assistant.citations import citation_registry, strip_sources
 from assistant.inf_graph_interview import build_graph as interview_builder
 from assistant.inf_graph_schema import ResearchGraphState, Analyst, InterviewState
+from assistant.prompt_assembly import assemble_prompt, prompt_part
+from assistant.profiling import profiled
 from assistant.services import safe_invoke
+from assistant.shared_state import create_checkpointer
 
 
-INSTRUCTIONS_FULL_REPORT_WRITER = """You are a technical writer creating a report on this overall topic:
-
-{topic}
+INSTRUCTIONS_FULL_REPORT_WRITER = """You are a technical writer creating a report on an overall topic, which follows these instructions.
     
 You have a team of analysts. Each analyst has done two things: 
 
@@ -33,16 +34,10 @@ To format your report:
 3. Use no sub-heading. 
 4. Start your report with a single title header: ## Insights
 5. Do not mention any analyst names in your report.
-6. Preserve any citations in the memos, which will be annotated in brackets, for example [1] or [2].
-7. Create a final, consolidated list of sources and add to a Sources section with the `## Sources` header.
-8. List your sources in order and do not repeat.
-
-[1] Source 1
-[2] Source 2
-
-Here are the memos from your analysts to build your report from: 
+6. Preserve any citations in the memos exactly as they are, which will be annotated in brackets as source ids, for example [S1a2b3c4d5e].
+7. Do not add a Sources section; it is assembled automatically from the citations.
 
-{context}"""
+The memos from your analysts to build your report from follow the topic."""
 
 
 def initialize_graph(state: ResearchGraphState) -> dict[str, Any]:
@@ -54,10 +49,12 @@ def initialize_graph(state: ResearchGraphState) -> dict[str, Any]:
     formatted_str_sections = '\n\n'.join([f'{section}' for section in sections])
 
     # Summarize the sections into a final report
-    system_message = INSTRUCTIONS_FULL_REPORT_WRITER.format(topic=topic, context=formatted_str_sections)
-    report = safe_invoke(
-        [SystemMessage(content=system_message)] + [HumanMessage(content=f'Write a report based upon these memos.')]
-    )
+    report = safe_invoke(assemble_prompt(
+        INSTRUCTIONS_FULL_REPORT_WRITER,
+        prompt_part('Overall topic', topic),
+        prompt_part('Memos', formatted_str_sections),
+        task='Write a report based upon these memos.'
+    ))
     return {'content': report.content}
 
 
@@ -70,14 +67,16 @@ def write_report(state: ResearchGraphState) -> dict[str, Any]:
     formatted_str_sections = '\n\n'.join([f'{section}' for section in sections])
 
     # Summarize the sections into a final report
-    system_message = INSTRUCTIONS_FULL_REPORT_WRITER.format(topic=topic, context=formatted_str_sections)
-    report = safe_invoke(
-        [SystemMessage(content=system_message)] + [HumanMessage(content=f'Write a report based upon these memos.')]
-    )
+    report = safe_invoke(assemble_prompt(
+        INSTRUCTIONS_FULL_REPORT_WRITER,
+        prompt_part('Overall topic', topic),
+        prompt_part('Memos', formatted_str_sections),
+        task='Write a report based upon these memos.'
+    ))
     return {'content': report.content}
 
 
-INSTRUCTIONS_FULL_REPORT_INTRO_AND_CONCLUSION = """You are a technical writer finishing a report on {topic}
+INSTRUCTIONS_FULL_REPORT_INTRO_AND_CONCLUSION = """You are a technical writer finishing a report on a topic, which follows these instructions.
 
 You will be given all of the sections of the report.
 
@@ -97,67 +96,53 @@ For your introduction, use ## Introduction as the section header.
 
 For your conclusion, use ## Conclusion as the section header.
 
-Here are the sections to reflect on for writing: {formatted_str_sections}"""
+The sections to reflect on for writing follow the topic."""
 
 
-def write_introduction(state: ResearchGraphState) -> dict[str, Any]:
-    # Full set of sections
-    sections = state['sections']
-    topic = state['topic']
+def intro_and_conclusion_prompt(state: ResearchGraphState, task: str) -> list[BaseMessage]:
+    """ Prompt of the introduction or the conclusion: both share everything but the final task """
 
     # Concat all sections together
-    formatted_str_sections = '\n\n'.join([f'{section}' for section in sections])
+    formatted_str_sections = '\n\n'.join([f'{section}' for section in state['sections']])
 
-    # Summarize the sections into a final report
+    return assemble_prompt(
+        INSTRUCTIONS_FULL_REPORT_INTRO_AND_CONCLUSION,
+        prompt_part('Topic', state['topic']),
+        prompt_part('Sections', formatted_str_sections),
+        task=task
+    )
 
-    instructions = INSTRUCTIONS_FULL_REPORT_INTRO_AND_CONCLUSION.format(topic=topic, formatted_str_sections=formatted_str_sections)
-    intro = safe_invoke([instructions] + [HumanMessage(content=f'Write the report introduction')])
+
+def write_introduction(state: ResearchGraphState) -> dict[str, Any]:
+    intro = safe_invoke(intro_and_conclusion_prompt(state, 'Write the report introduction'))
     return {'introduction': intro.content}
 
 
 def write_conclusion(state: ResearchGraphState) -> dict[str, Any]:
-    # Full set of sections
-    sections = state['sections']
-    topic = state['topic']
-
-    # Concat all sections together
-    formatted_str_sections = '\n\n'.join([f'{section}' for section in sections])
-
-    # Summarize the sections into a final report
-
-    instructions = INSTRUCTIONS_FULL_REPORT_INTRO_AND_CONCLUSION.format(topic=topic, formatted_str_sections=formatted_str_sections)
-    conclusion = safe_invoke([instructions] + [HumanMessage(content=f'Write the report conclusion')])
+    conclusion = safe_invoke(intro_and_conclusion_prompt(state, 'Write the report conclusion'))
     return {'conclusion': conclusion.content}
 
 
 def finalize_report(state: ResearchGraphState) -> dict[str, str]:
     """ This is the "reduce" step where we gather all the sections, combine them, and reflect on them to write the intro/conclusion """
     # Save full final report
-    content = state['content']
+    content = strip_sources(state['content'])
     if content.startswith('## Insights'):
-        content = content.strip('## Insights')
-    if '## Sources' in content:
-        try:
-            content, sources = content.split('\n## Sources\n')
-        except:
-            sources = None
-    else:
-        sources = None
+        content = content[len('## Insights'):]
 
+    # Number the citations globally and build the Sources section from the citation registry
     final_report = state['introduction'] + '\n\n---\n\n' + content + '\n\n---\n\n' + state['conclusion']
-    if sources is not None:
-        final_report += '\n\n## Sources\n' + sources
-    return {'final_report': final_report}
+    return {'final_report': citation_registry.render(final_report, sources_header='## Sources')}
 
 
 def build_graph() -> StateGraph:
     # Add nodes and edges
     builder = StateGraph(ResearchGraphState)
 
-    builder.add_node('write_report', write_report)
-    builder.add_node('write_introduction', write_introduction)
-    builder.add_node('write_conclusion', write_conclusion)
-    builder.add_node('finalize_report', finalize_report)
+    builder.add_node('write_report', profiled(write_report))
+    builder.add_node('write_introduction', profiled(write_introduction))
+    builder.add_node('write_conclusion', profiled(write_conclusion))
+    builder.add_node('finalize_report', profiled(finalize_report))
 
     # Logic
     builder.add_edge(START, 'write_report')
@@ -168,5 +153,5 @@ def build_graph() -> StateGraph:
     return builder
 
 
-memory = MemorySaver()
+memory = create_checkpointer()
 graph = build_graph().compile(checkpointer=memory)
@@ -0,0 +1,213 @@
+import json
+import os
+import time
+from typing import Any, Optional
+
+from pydantic import BaseModel, Field
+
+from assistant.database import POSTGRES, SQLITE, SqlStore, get_db_connection, sqlite_connection_factory
+
+JOB_PERSONAS = 'personas'
+JOB_INTERVIEW = 'interview'
+JOB_REPORT = 'report'
+
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+
+# Running jobs whose worker has not sent a heartbeat for this long are handed to another worker
+JOB_LEASE_SECONDS = 600
+# Jobs whose lease has expired this many times, e.g. because they crash their worker, are failed for good
+MAX_JOB_ATTEMPTS = 3
+
+DDL = {
+    POSTGRES: [
+        """CREATE TABLE IF NOT EXISTS jobs (
+            job_id SERIAL PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL,
+            result TEXT,
+            error TEXT,
+            worker TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at DOUBLE PRECISION NOT NULL,
+            heartbeat_at DOUBLE PRECISION
+        )""",
+        'CREATE INDEX IF NOT EXISTS jobs_status_idx ON jobs (status, job_id)',
+        """CREATE TABLE IF NOT EXISTS job_events (
+            event_id SERIAL PRIMARY KEY,
+            job_id INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            created_at DOUBLE PRECISION NOT NULL
+        )""",
+        'CREATE INDEX IF NOT EXISTS job_events_job_idx ON job_events (job_id, event_id)',
+    ],
+    SQLITE: [
+        """CREATE TABLE IF NOT EXISTS jobs (
+            job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL,
+            result TEXT,
+            error TEXT,
+            worker TEXT,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            heartbeat_at REAL
+        )""",
+        'CREATE INDEX IF NOT EXISTS jobs_status_idx ON jobs (status, job_id)',
+        """CREATE TABLE IF NOT EXISTS job_events (
+            event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            job_id INTEGER NOT NULL,
+            payload TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )""",
+        'CREATE INDEX IF NOT EXISTS job_events_job_idx ON job_events (job_id, event_id)',
+    ],
+}
+
+
+class Job(BaseModel):
+    job_id: int = Field(description='Id of the job.')
+    kind: str = Field(description='Kind of the job: personas, interview or report.')
+    payload: dict[str, Any] = Field(description='Input of the job.')
+    status: str = Field(description='One of queued, running, done, failed.')
+    result: Optional[dict[str, Any]] = Field(default=None, description='Output of a finished job.')
+    error: Optional[str] = Field(default=None, description='Error of a failed job.')
+
+
+class JobQueue(SqlStore):
+    """
+    Queue of graph jobs, shared by the web UI, which enqueues them, and the worker processes, which run them.
+
+    Workers claim jobs with `FOR UPDATE SKIP LOCKED` on PostgreSQL, so that any number of them can poll
+    the queue without blocking each other. Progress events of a job are appended to `job_events`.
+
+    A claim is a lease: the claiming worker keeps it by sending heartbeats, and only the worker currently
+    holding the lease can publish events for the job and finish it. A worker whose lease expired and was
+    taken over drops its result.
+    """
+
+    ddl = DDL
+
+    def enqueue(self, kind: str, payload: dict[str, Any]) -> int:
+        """Adds a job to the queue and returns its id."""
+        return self.execute(
+            'INSERT INTO jobs (kind, payload, status, created_at) VALUES (?, ?, ?, ?) RETURNING job_id',
+            (kind, json.dumps(payload), STATUS_QUEUED, time.time())
+        )[0][0]
+
+    def claim(self, worker: str) -> Optional[Job]:
+        """
+        Takes the oldest queued job, or a running job whose lease has expired, and marks it as running.
+        Expired jobs that have used up their MAX_JOB_ATTEMPTS are failed instead.
+        """
+        now = time.time()
+        expired_at = now - JOB_LEASE_SECONDS
+
+        # SQLite has no row locks; there the transaction holds the database write lock instead
+        lock_clause = 'FOR UPDATE SKIP LOCKED' if self.dialect == POSTGRES else ''
+        with self.transaction() as cursor:
+            cursor.execute(
+                self.sql('UPDATE jobs SET status = ?, error = ? '
+                         'WHERE status = ? AND heartbeat_at < ? AND attempts >= ?'),
+                (STATUS_FAILED, f'Lease expired after {MAX_JOB_ATTEMPTS} attempts', STATUS_RUNNING, expired_at,
+                 MAX_JOB_ATTEMPTS)
+            )
+            cursor.execute(self.sql(
+                f"""UPDATE jobs SET status = ?, worker = ?, heartbeat_at = ?, attempts = attempts + 1
+                    WHERE job_id = (
+                        SELECT job_id FROM jobs
+                        WHERE status = ? OR (status = ? AND heartbeat_at < ?)
+                        ORDER BY job_id
+                        LIMIT 1
+                        {lock_clause}
+                    )
+                    RETURNING job_id, kind, payload"""
+            ), (STATUS_RUNNING, worker, now, STATUS_QUEUED, STATUS_RUNNING, expired_at))
+            rows = cursor.fetchall()
+
+        if not rows:
+            return None
+        job_id, kind, payload = rows[0]
+        return Job(job_id=job_id, kind=kind, payload=json.loads(payload), status=STATUS_RUNNING)
+
+    def heartbeat(self, job_id: int, worker: str) -> bool:
+        """Extends the lease of a running job. Returns False if the worker no longer holds the lease."""
+        return bool(self.execute(
+            'UPDATE jobs SET heartbeat_at = ? WHERE job_id = ? AND worker = ? AND status = ? RETURNING job_id',
+            (time.time(), job_id, worker, STATUS_RUNNING)
+        ))
+
+    def complete(self, job_id: int, worker: str, result: dict[str, Any]) -> bool:
+        """Stores the result of the job. Returns False, storing nothing, if the worker no longer holds the lease."""
+        return bool(self.execute(
+            'UPDATE jobs SET status = ?, result = ? WHERE job_id = ? AND worker = ? AND status = ? RETURNING job_id',
+            (STATUS_DONE, json.dumps(result), job_id, worker, STATUS_RUNNING)
+        ))
+
+    def fail(self, job_id: int, worker: str, error: str, result: Optional[dict[str, Any]] = None) -> bool:
+        """
+        Stores the error of the job, and what it has got done, such as its usage, as result. Returns False,
+        storing nothing, if the worker no longer holds the lease.
+        """
+        return bool(self.execute(
+            'UPDATE jobs SET status = ?, error = ?, result = ? '
+            'WHERE job_id = ? AND worker = ? AND status = ? RETURNING job_id',
+            (STATUS_FAILED, error, json.dumps(result) if result is not None else None, job_id, worker, STATUS_RUNNING)
+        ))
+
+    def get(self, job_id: int) -> Job:
+        job_id, kind, payload, status, result, error = self.execute(
+            'SELECT job_id, kind, payload, status, result, error FROM jobs WHERE job_id = ?', (job_id,)
+        )[0]
+        return Job(
+            job_id=job_id, kind=kind, payload=json.loads(payload), status=status,
+            result=json.loads(result) if result else None, error=error
+        )
+
+    def publish(self, job_id: int, worker: str, event: dict[str, Any]) -> bool:
+        """
+        Appends a progress event of the job, and extends its lease. Returns False, appending nothing,
+        if the worker no longer holds the lease.
+        """
+        now = time.time()
+        with self.transaction() as cursor:
+            cursor.execute(
+                self.sql('UPDATE jobs SET heartbeat_at = ? WHERE job_id = ? AND worker = ? AND status = ? '
+                         'RETURNING job_id'),
+                (now, job_id, worker, STATUS_RUNNING)
+            )
+            if not cursor.fetchall():
+                return False
+            cursor.execute(self.sql('INSERT INTO job_events (job_id, payload, created_at) VALUES (?, ?, ?)'),
+                           (job_id, json.dumps(event), now))
+            return True
+
+    def events(self, job_id: int, after_event_id: int = 0) -> list[tuple[int, dict[str, Any]]]:
+        """Progress events of the job newer than `after_event_id`, as (event_id, event) tuples."""
+        rows = self.execute(
+            'SELECT event_id, payload FROM job_events WHERE job_id = ? AND event_id > ? ORDER BY event_id',
+            (job_id, after_event_id)
+        )
+        return [(event_id, json.loads(payload)) for event_id, payload in rows]
+
+
+def job_queue_backend() -> Optional[str]:
+    """Backend of the job queue: AGENTCRAFT_JOB_QUEUE = postgres | sqlite, or None to run the graphs in-process."""
+    return os.getenv('AGENTCRAFT_JOB_QUEUE')
+
+
+def create_job_queue() -> Optional[JobQueue]:
+    """
+    Creates the job queue selected by AGENTCRAFT_JOB_QUEUE: `postgres` for the database of `assistant.database`,
+    `sqlite` for a local file (AGENTCRAFT_JOB_QUEUE_SQLITE). Returns None when unset, i.e. graphs run in-process.
+    """
+    backend = job_queue_backend()
+    if backend == POSTGRES:
+        return JobQueue(get_db_connection, POSTGRES)
+    if backend == SQLITE:
+        return JobQueue(sqlite_connection_factory(os.getenv('AGENTCRAFT_JOB_QUEUE_SQLITE', 'jobs.sqlite3')), SQLITE)
+    return None
@@ -0,0 +1,341 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import queue
+import resource
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from os import path
+from typing import Any, Optional
+
+from bokeh.core.serialization import Serializable
+from bokeh.document.events import MessageSentEvent
+
+# Sampling period of the event loop lag monitor
+LOOP_LAG_PERIOD_SECONDS = 0.05
+# Longest wait for a session to render, or for a phase of a session to complete
+SESSION_TIMEOUT_SECONDS = 600
+COMPLETION_POLL_SECONDS = 0.05
+
+QUERY = 'What compounds have a similar molecular fingerprint to Ibuprofen?'
+
+# Widgets of the app driven by the clients. The server tags them with a CSS class, by which the clients find
+# their models in the document they pulled
+DRIVEN_WIDGETS = {
+    'query': 'query_input',
+    'submit': 'submit_button',
+    'fresh': 'btn_research_fresh',
+    'interviews': 'btn_interview_start',
+    'report': 'btn_report_start',
+}
+CSS_CLASS_PREFIX = 'load-test-'
+
+
+def configure_environment(args: argparse.Namespace) -> None:
+    """Points the app at fake backends and throwaway stores. Must run before `assistant.app` is imported."""
+    os.environ['AGENTCRAFT_FAKE_BACKENDS'] = '1'
+    os.environ['AGENTCRAFT_FAKE_LATENCY'] = str(args.latency)
+    os.environ['AGENTCRAFT_RATE_LIMITS'] = 'off'
+    os.environ['AGENTCRAFT_CASSETTE_MODE'] = 'off'
+    os.environ['AGENTCRAFT_SHARED_STATE'] = 'memory'
+    os.environ['AGENTCRAFT_RESEARCH_SQLITE'] = path.join(tempfile.mkdtemp(prefix='load-test-'), 'research.sqlite3')
+    os.environ.pop('AGENTCRAFT_JOB_QUEUE', None)
+    os.environ.pop('AGENTCRAFT_BLOB_DIR', None)
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process; the peak resident set size where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    if not values:
+        return dict()
+    ordered = sorted(values)
+
+    def at(q: float) -> float:
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    return {'p50': at(0.50), 'p90': at(0.90), 'p95': at(0.95), 'p99': at(0.99), 'max': ordered[-1]}
+
+
+class LoadTestServer:
+    """
+    The Panel app, served from a thread of this process with its own event loop, so that the lag of the loop
+    and the memory of the sessions can be measured from the inside.
+
+    Once the app has handled a change of a driven widget, the server records it in `completed`, a dict shared
+    with the client process under `<session id>/<widget>`, along with the state the client needs to go on.
+    """
+
+    def __init__(self, port: int, nthreads: int, completed: Any) -> None:
+        self.port = port
+        self.nthreads = nthreads
+        self.completed = completed
+        self.loop_lags: list[float] = list()
+        self.ready = threading.Event()
+        self.server = None
+        self._thread = threading.Thread(target=self._run, name='load-test-server', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+        self.ready.wait()
+
+    def stop(self) -> None:
+        self.server.io_loop.add_callback(self.server.io_loop.stop)
+        self._thread.join(timeout=10)
+
+    def _create_session(self) -> Any:
+        import panel as pn
+        from assistant.app import AssistantApp
+
+        app = AssistantApp()
+        session_id = pn.state.curdoc.session_context.id
+        for key, attribute in DRIVEN_WIDGETS.items():
+            widget = getattr(app, attribute)
+            widget.css_classes = [*widget.css_classes, f'{CSS_CLASS_PREFIX}{key}']
+            # Watchers run in the order they were added: this one after the callback of the app
+            widget.param.watch(partial(self._record_completion, app, session_id, key),
+                               'clicks' if isinstance(widget, pn.widgets.Button) else 'value', onlychanged=False)
+        return app.get_dashboard()
+
+    def _record_completion(self, app: Any, session_id: str, key: str, event: Any = None) -> None:
+        self.completed[f'{session_id}/{key}'] = {
+            'research_reuse_offered': app.clmn_research_reuse.visible,
+            'final_report': bool(app.final_report),
+        }
+
+    async def _monitor_loop_lag(self) -> None:
+        while True:
+            started_at = time.perf_counter()
+            await asyncio.sleep(LOOP_LAG_PERIOD_SECONDS)
+            self.loop_lags.append(time.perf_counter() - started_at - LOOP_LAG_PERIOD_SECONDS)
+
+    def _run(self) -> None:
+        import panel as pn
+        from panel.io.server import get_server
+
+        asyncio.set_event_loop(asyncio.new_event_loop())
+        pn.extension(nthreads=self.nthreads)
+        self.server = get_server(self._create_session, port=self.port, websocket_origin=['*'], show=False,
+                                 start=False)
+        self.server.start()
+        self.server.io_loop.spawn_callback(self._monitor_loop_lag)
+        self.ready.set()
+        self.server.io_loop.start()
+
+
+class ButtonClickMessage(Serializable):
+    """
+    Click of a button model, serialized like BokehJS serializes it in a browser: the button travels as a reference
+    to the model of the server document.
+    """
+
+    def __init__(self, model: Any) -> None:
+        self.model = model
+
+    def to_serializable(self, serializer: Any) -> dict[str, Any]:
+        return {
+            'type': 'event',
+            'name': 'button_click',
+            'values': {'type': 'map', 'entries': [['model', {'id': self.model.id}]]},
+        }
+
+
+class SessionDriver:
+    """
+    Drives a session from its client document, as a browser would: widget values are set on the models of the
+    pulled document, and clicks are sent as button events. Both reach the server over the websocket and go
+    through Panel's dispatch of browser events, including its callback threads.
+    """
+
+    def __init__(self, client: Any, completed: Any) -> None:
+        self.client = client
+        self.completed = completed
+        self.models = dict()
+        for model in client.document.models:
+            for css_class in getattr(model, 'css_classes', None) or []:
+                if css_class.startswith(CSS_CLASS_PREFIX):
+                    self.models[css_class[len(CSS_CLASS_PREFIX):]] = model
+
+    def set_value(self, key: str, value: Any) -> dict[str, Any]:
+        self.models[key].value = value
+        return self._wait_for(key)
+
+    def click(self, key: str) -> dict[str, Any]:
+        document = self.client.document
+        document.callbacks.trigger_on_change(
+            MessageSentEvent(document, 'bokeh_event', ButtonClickMessage(self.models[key]))
+        )
+        return self._wait_for(key)
+
+    def _wait_for(self, key: str) -> dict[str, Any]:
+        """Sends the pending changes to the server and waits until the app has handled them."""
+        self.client.force_roundtrip()
+        completion_key = f'{self.client.id}/{key}'
+        deadline = time.monotonic() + SESSION_TIMEOUT_SECONDS
+        while completion_key not in self.completed:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'The app did not complete {key} within {SESSION_TIMEOUT_SECONDS}s')
+            time.sleep(COMPLETION_POLL_SECONDS)
+        return self.completed.pop(completion_key)
+
+
+def run_session(port: int, i: int, completed: Any, rendered: Any, start: Any) -> dict[str, Any]:
+    """
+    Opens a websocket session like a browser would and, once all sessions have rendered, drives it through
+    the analyst personas, the interviews and the report. Returns the timings of the session.
+    """
+    from bokeh.client import pull_session
+
+    timings: dict[str, Any] = {'session': i}
+    started_at = time.perf_counter()
+    try:
+        client = pull_session(url=f'http://localhost:{port}/')
+    except Exception:
+        timings['error'] = traceback.format_exc()
+        return timings
+    finally:
+        rendered.release()
+    timings['first_render'] = time.perf_counter() - started_at
+    start.wait()
+
+    try:
+        driver = SessionDriver(client, completed)
+        driver.set_value('query', f'{QUERY} ({i})')
+
+        phase_started_at = time.perf_counter()
+        if driver.click('submit')['research_reuse_offered']:
+            driver.click('fresh')
+        timings['personas'] = time.perf_counter() - phase_started_at
+
+        phase_started_at = time.perf_counter()
+        driver.click('interviews')
+        timings['interviews'] = time.perf_counter() - phase_started_at
+
+        phase_started_at = time.perf_counter()
+        if not driver.click('report')['final_report']:
+            raise RuntimeError('No final report')
+        timings['report'] = time.perf_counter() - phase_started_at
+
+        timings['end_to_end'] = sum(timings[phase] for phase in ('personas', 'interviews', 'report'))
+    except Exception:
+        timings['error'] = traceback.format_exc()
+    finally:
+        client.close()
+    return timings
+
+
+def run_clients(port: int, sessions: int, ramp_up: float, completed: Any, rendered: Any, start: Any,
+                results: Any) -> None:
+    """Client process: runs the sessions in threads, and puts the list of their timings into `results`."""
+    # Registers the Bokeh models of Panel, which the documents pulled from the server are made of
+    import panel  # noqa: F401
+
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        futures = list()
+        for i in range(sessions):
+            futures.append(executor.submit(run_session, port, i, completed, rendered, start))
+            time.sleep(ramp_up / max(sessions, 1))
+        results.put([future.result() for future in futures])
+
+
+def run_load_test(args: argparse.Namespace) -> dict[str, Any]:
+    configure_environment(args)
+
+    # The clients run in a process of their own, so that the memory of their document replicas
+    # does not count towards the memory of the server's sessions
+    context = multiprocessing.get_context('spawn')
+    with context.Manager() as manager:
+        completed = manager.dict()
+        server = LoadTestServer(args.port, args.nthreads, completed)
+        server.start()
+
+        rss_before = current_rss_bytes()
+        rendered, start, results = context.Semaphore(0), context.Event(), context.Queue()
+        clients = context.Process(
+            target=run_clients, name='load-test-clients', daemon=True,
+            args=(args.port, args.sessions, args.ramp_up, completed, rendered, start, results)
+        )
+        clients.start()
+
+        # Memory of the sessions once all of them have rendered, before the workflows add their state
+        for _ in range(args.sessions):
+            if not rendered.acquire(timeout=SESSION_TIMEOUT_SECONDS):
+                break
+        rss_rendered = current_rss_bytes()
+        start.set()
+        try:
+            session_results = results.get(timeout=SESSION_TIMEOUT_SECONDS * 3)
+        except queue.Empty:
+            session_results = [{'session': i, 'error': 'Client process timed out'} for i in range(args.sessions)]
+        rss_after = current_rss_bytes()
+        clients.join(timeout=10)
+        server.stop()
+
+    succeeded = [result for result in session_results if 'error' not in result]
+    report = {
+        'sessions': args.sessions,
+        'failed': len(session_results) - len(succeeded),
+        'fake_latency': args.latency,
+        'nthreads': args.nthreads,
+        'memory_per_session_rendered_mb': (rss_rendered - rss_before) / args.sessions / 2 ** 20,
+        'memory_per_session_after_mb': (rss_after - rss_before) / args.sessions / 2 ** 20,
+        'loop_lag': percentiles(server.loop_lags),
+        'first_render': percentiles([result['first_render'] for result in session_results
+                                     if 'first_render' in result]),
+    }
+    for phase in ('personas', 'interviews', 'report', 'end_to_end'):
+        report[phase] = percentiles([result[phase] for result in succeeded])
+    report['errors'] = [result['error'] for result in session_results if 'error' in result][:5]
+    return report
+
+
+def format_report(report: dict[str, Any]) -> str:
+    lines = [
+        f"Sessions: {report['sessions']} ({report['failed']} failed), fake latency {report['fake_latency']}s, "
+        f"{report['nthreads']} callback threads",
+        f"Memory per session: {report['memory_per_session_rendered_mb']:.1f} MB rendered, "
+        f"{report['memory_per_session_after_mb']:.1f} MB after the workflow",
+        f"{'seconds':<14}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}",
+    ]
+    for metric in ('loop_lag', 'first_render', 'personas', 'interviews', 'report', 'end_to_end'):
+        values = report[metric]
+        if values:
+            lines.append(f'{metric:<14}' + ''.join(f'{values[q]:>9.3f}' for q in ('p50', 'p90', 'p95', 'p99', 'max')))
+    lines += report['errors']
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description='Drives concurrent dashboard sessions over websockets against fake LLM and search backends.'
+    )
+    parser.add_argument('--sessions', type=int, default=10, help='number of concurrent sessions')
+    parser.add_argument('--ramp-up', type=float, default=5.0, help='seconds over which the sessions are started')
+    parser.add_argument('--latency', type=float, default=0.2, help='mean latency of a fake LLM or search call')
+    parser.add_argument('--nthreads', type=int, default=int(os.getenv('PANEL_NTHREADS', '4')),
+                        help='callback threads of the Panel server')
+    parser.add_argument('--port', type=int, default=5007, help='port of the Panel server')
+    parser.add_argument('--output', help='write the report as JSON to this file')
+    args = parser.parse_args(argv)
+
+    report = run_load_test(args)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Optional
+
+from assistant.inf_graph_schema import Analyst
+from assistant.prompt_assembly import assemble_prompt, prompt_part
+from assistant.services import safe_invoke_perspective
+from assistant.text_similarity import STOP_WORDS, jaccard, tokenize
+
+# Number of personas requested from a single structured-output call
+BATCH_SIZE = 2
+# Personas whose role and description overlap at least this much are considered duplicates
+DUPLICATE_SIMILARITY = 0.5
+# Rounds of regeneration for the slots freed by duplicates
+MAX_REGENERATION_ROUNDS = 2
+# Name tokens that do not identify a persona
+NAME_TITLES = {'prof', 'phd'}
+# Perspectives handed out to the parallel batches, so that each batch explores a different angle of the topic
+THEME_LENSES = [
+    'scientific and technical foundations',
+    'practical applications and case studies',
+    'industry, market and business impact',
+    'regulatory, ethical and societal implications',
+    'data, methodology and evaluation',
+]
+
+INSTRUCTIONS_CREATE_ANALYST_PERSONAS = """
+You are tasked with creating a set of Analyst Personas. Follow these instructions carefully:
+
+1. First, review the research topic, which follows these instructions.
+
+2. Examine any editorial feedback that has been optionally provided after the topic to guide creation of the Analyst Personas.
+
+3. Determine the most interesting themes based upon documents and / or feedback, looking at the topic through the given lens.
+
+4. Pick as many top themes as the number of Analyst Personas requested.
+
+5. Assign one analyst to each theme.
+
+6. Do not duplicate the focus of the already existing Analyst Personas listed last.
+"""
+
+INSTRUCTIONS_REFINE_ANALYST_PERSONA = """
+You are tasked with refining a single Analyst Persona. Follow these instructions carefully:
+
+1. First, review the research topic, which follows these instructions.
+
+2. Review the Analyst Persona to refine.
+
+3. Apply the editorial feedback to this Analyst Persona, keeping everything the feedback does not touch.
+
+4. Do not duplicate the focus of the other Analyst Personas.
+
+5. Return exactly one Analyst Persona.
+"""
+
+
+def persona_similarity(a: Analyst, b: Analyst) -> float:
+    """ Similarity of two personas on their role and description, between 0.0 and 1.0 """
+    role_similarity = jaccard(set(tokenize(a.role)) - STOP_WORDS, set(tokenize(b.role)) - STOP_WORDS)
+    description_similarity = jaccard(
+        set(tokenize(a.description)) - STOP_WORDS, set(tokenize(b.description)) - STOP_WORDS
+    )
+    return (role_similarity + description_similarity) / 2
+
+
+def dedupe_personas(analysts: list[Analyst], keep: Optional[list[Analyst]] = None) -> list[Analyst]:
+    """ Drop the personas that duplicate an earlier persona, or one of the `keep` personas, by name or focus """
+    unique = list(keep or [])
+    for analyst in analysts:
+        if any(analyst.name == other.name or persona_similarity(analyst, other) >= DUPLICATE_SIMILARITY
+               for other in unique):
+            continue
+        unique.append(analyst)
+    return unique[len(keep or []):]
+
+
+def format_personas(analysts: list[Analyst]) -> str:
+    if not analysts:
+        return 'None'
+    return '\n'.join(analyst.persona for analyst in analysts)
+
+
+def _generate_batch(topic: str, count: int, lens: str, human_analyst_feedback: Optional[str],
+                    existing: list[Analyst]) -> list[Analyst]:
+    """ Single structured-output call generating `count` personas """
+    # Topic and feedback are shared by the parallel batches, the lens and the count differ
+    perspectives = safe_invoke_perspective(assemble_prompt(
+        INSTRUCTIONS_CREATE_ANALYST_PERSONAS,
+        prompt_part('Research topic', topic),
+        prompt_part('Editorial feedback', human_analyst_feedback or 'None'),
+        prompt_part('Existing Analyst Personas', format_personas(existing)),
+        task=f'Generate a set of {count} Analyst Personas, looking at the topic through the lens of: {lens}'
+    ))
+    return perspectives.analysts[:count]
+
+
+def fill_personas(topic: str, analysts: list[Analyst], max_analysts: int,
+                  human_analyst_feedback: Optional[str] = None) -> list[Analyst]:
+    """
+    Top up the `analysts` to `max_analysts` unique personas. The missing slots are generated in parallel
+    batches of BATCH_SIZE, each exploring its own theme lens, and only the slots lost to duplicates are regenerated.
+    """
+    analysts = dedupe_personas(analysts)[:max_analysts]
+
+    for regeneration_round in range(MAX_REGENERATION_ROUNDS + 1):
+        missing = max_analysts - len(analysts)
+        if missing <= 0:
+            break
+
+        batch_sizes = [min(BATCH_SIZE, missing - i) for i in range(0, missing, BATCH_SIZE)]
+        with ThreadPoolExecutor(max_workers=len(batch_sizes)) as executor:
+            futures = [
+                # Run each batch in a copy of the current context, so that the active cassette is visible to it
+                executor.submit(
+                    copy_context().run, _generate_batch, topic, batch_size,
+                    THEME_LENSES[(regeneration_round + i) % len(THEME_LENSES)], human_analyst_feedback, analysts
+                )
+                for i, batch_size in enumerate(batch_sizes)
+            ]
+            candidates = [analyst for future in futures for analyst in future.result()]
+
+        analysts += dedupe_personas(candidates, keep=analysts)[:missing]
+    return analysts
+
+
+def affected_personas(analysts: list[Analyst], human_analyst_feedback: str) -> list[int]:
+    """ Indices of the personas the feedback refers to by name or role. Feedback naming none of them affects all """
+    feedback = human_analyst_feedback.lower()
+    feedback_tokens = set(tokenize(feedback))
+
+    affected = list()
+    for i, analyst in enumerate(analysts):
+        # Match on the first or last name, ignoring initials and academic titles
+        name_tokens = {token for token in tokenize(analyst.name) if len(token) > 2 and token not in NAME_TITLES}
+        if analyst.name.lower() in feedback or analyst.role.lower() in feedback or name_tokens & feedback_tokens:
+            affected.append(i)
+    return affected or list(range(len(analysts)))
+
+
+def _refine_persona(topic: str, analyst: Analyst, human_analyst_feedback: str, others: list[Analyst]) -> Analyst:
+    """ Single structured-output call refining one persona """
+    # Topic and feedback are shared by the personas refined in parallel
+    perspectives = safe_invoke_perspective(assemble_prompt(
+        INSTRUCTIONS_REFINE_ANALYST_PERSONA,
+        prompt_part('Research topic', topic),
+        prompt_part('Editorial feedback', human_analyst_feedback),
+        prompt_part('Other Analyst Personas', format_personas(others)),
+        task=prompt_part('Refine this Analyst Persona', analyst.persona)
+    ))
+    return perspectives.analysts[0] if perspectives.analysts else analyst
+
+
+def refine_personas(topic: str, analysts: list[Analyst], max_analysts: int,
+                    human_analyst_feedback: str) -> list[Analyst]:
+    """ Refine, in parallel, only the personas affected by the feedback, then top up or trim to `max_analysts` """
+    indices = affected_personas(analysts, human_analyst_feedback)
+
+    refined = list(analysts)
+    with ThreadPoolExecutor(max_workers=len(indices)) as executor:
+        futures = {
+            i: executor.submit(
+                copy_context().run, _refine_persona, topic, analysts[i], human_analyst_feedback,
+                [other for j, other in enumerate(analysts) if j != i]
+            )
+            for i in indices
+        }
+        for i, future in futures.items():
+            refined[i] = future.result()
+
+    return fill_personas(topic, refined, max_analysts, human_analyst_feedback)
@@ -0,0 +1,163 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from os import path
+from types import FrameType
+from typing import Any, Callable, Iterator, Optional
+
+from langchain_core.runnables import RunnableConfig
+
+# Seconds between two stack samples of the profiled threads
+SAMPLING_INTERVAL_SECONDS = float(os.getenv('AGENTCRAFT_PROFILE_INTERVAL', '0.005'))
+
+
+def profile_dir() -> str:
+    """Directory of the profiles, one sub-directory per run: AGENTCRAFT_PROFILE_DIR."""
+    return os.getenv('AGENTCRAFT_PROFILE_DIR', 'runs')
+
+
+def collapse_stack(frame: FrameType) -> str:
+    """Stack of the frame, outermost first, in the collapsed format of flame graphs."""
+    frames = list()
+    while frame is not None:
+        code = frame.f_code
+        frames.append(f'{code.co_name} ({path.basename(code.co_filename)}:{code.co_firstlineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(frames))
+
+
+class Profiler:
+    """
+    Sampling profiler of a graph run. A background thread samples, every `interval` seconds, the stacks of
+    the threads currently running a node or the graph itself, attributing each sample to that node. Nodes
+    also measure their wall and CPU time, the difference being the time spent waiting, e.g. on the network.
+    """
+
+    def __init__(self, name: str, interval: float = SAMPLING_INTERVAL_SECONDS) -> None:
+        self.name = name
+        self.interval = interval
+        self.samples: Counter[str] = Counter()
+        self.stats: dict[str, dict[str, float]] = defaultdict(lambda: {'calls': 0, 'wall': 0.0, 'cpu': 0.0})
+        self._labels: dict[int, list[str]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name=f'profiler-{name}', daemon=True)
+
+    def start(self) -> None:
+        self._sampler.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._sampler.join()
+
+    @contextmanager
+    def label(self, label: str) -> Iterator[None]:
+        """Attributes the samples and the wall and CPU time of the current thread within the block to `label`."""
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._labels[thread_id].append(label)
+        started_at, cpu_started_at = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - started_at, time.thread_time() - cpu_started_at
+            with self._lock:
+                self._labels[thread_id].pop()
+                if not self._labels[thread_id]:
+                    del self._labels[thread_id]
+                self.stats[label]['calls'] += 1
+                self.stats[label]['wall'] += wall
+                self.stats[label]['cpu'] += cpu
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                labels = {thread_id: thread_labels[-1] for thread_id, thread_labels in self._labels.items()}
+            frames = sys._current_frames()
+            for thread_id, label in labels.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.samples[f'{label};{collapse_stack(frame)}'] += 1
+
+    def summary(self) -> dict[str, Any]:
+        samples_per_label: Counter[str] = Counter()
+        for stack, count in self.samples.items():
+            samples_per_label[stack.split(';', 1)[0]] += count
+        return {
+            'run': self.name,
+            'interval': self.interval,
+            'nodes': {
+                label: {
+                    'calls': stats['calls'],
+                    'wall': round(stats['wall'], 4),
+                    'cpu': round(stats['cpu'], 4),
+                    'wait': round(max(stats['wall'] - stats['cpu'], 0.0), 4),
+                    'samples': samples_per_label[label],
+                }
+                for label, stats in self.stats.items()
+            },
+        }
+
+    def save(self, run_dir: str) -> str:
+        """
+        Writes the samples as `<name>.folded`, the input of flamegraph.pl and speedscope, and the per-node
+        summary as `<name>.json`. Returns the path of the folded stacks.
+        """
+        os.makedirs(run_dir, exist_ok=True)
+        fqfp_folded = path.join(run_dir, f'{self.name}.folded')
+        with open(fqfp_folded, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f'{stack} {count}\n')
+        with open(path.join(run_dir, f'{self.name}.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2)
+        return fqfp_folded
+
+
+current_profiler: ContextVar[Optional[Profiler]] = ContextVar('current_profiler', default=None)
+
+
+@contextmanager
+def profile_run(run_id: str, name: str, enabled: bool = True) -> Iterator[Optional[Profiler]]:
+    """
+    Profiles the graph run within the block, saving the profile under `<AGENTCRAFT_PROFILE_DIR>/<run_id>/`.
+    Graph runs nested in a profiled run are part of its profile.
+    """
+    profiler = current_profiler.get()
+    if not enabled or profiler is not None:
+        yield profiler
+        return
+
+    profiler = Profiler(name)
+    token = current_profiler.set(profiler)
+    profiler.start()
+    try:
+        with profiler.label(name):
+            yield profiler
+    finally:
+        current_profiler.reset(token)
+        profiler.stop()
+        profiler.save(path.join(profile_dir(), run_id))
+
+
+def profiled(func: Callable) -> Callable:
+    """
+    Wraps a graph node so that, within a profiled run, its samples and times are attributed to the node.
+    Outside of profiled runs the wrapper costs a context variable lookup.
+    """
+
+    # Not functools.wraps: LangGraph inspects the signature of the wrapper to pass the config with the node name
+    def node(state: Any, config: RunnableConfig) -> Any:
+        profiler = current_profiler.get()
+        if profiler is None:
+            return func(state)
+        with profiler.label(config['metadata']['langgraph_node']):
+            return func(state)
+
+    node.__name__ = func.__name__
+    node.__doc__ = func.__doc__
+    return node
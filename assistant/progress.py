@@ -0,0 +1,145 @@
+import time
+from contextvars import copy_context
+from threading import Lock, Timer
+from typing import Any, Callable, Optional
+
+from langgraph.graph.state import CompiledStateGraph
+from pydantic import BaseModel, Field
+
+STATUS_START = 'start'
+STATUS_END = 'end'
+STATUS_ERROR = 'error'
+STATUS_DONE = 'done'
+
+# Minimal interval between two deliveries of the bus to its subscribers
+MIN_DELIVERY_INTERVAL_SECONDS = 0.5
+
+
+class ProgressEvent(BaseModel):
+    graph: str = Field(description='Name of the graph run.')
+    node: str = Field(description='Node the event refers to; empty for the done or error event closing the run.')
+    status: str = Field(description='One of start, end, error, done.')
+    step: int = Field(default=0, description='Superstep of the graph run.')
+    turn: Optional[int] = Field(default=None, description='Question - answer turn of an interview.')
+    retrieved: Optional[int] = Field(default=None, description='Number of documents retrieved by the node.')
+    elapsed: float = Field(description='Seconds since the start of the graph run.')
+    node_elapsed: Optional[float] = Field(default=None, description='Seconds the node took, for end events.')
+
+    def describe(self) -> str:
+        """One-line, human-readable description of the event."""
+        if self.status == STATUS_DONE:
+            return f'`{self.graph}` finished in {self.elapsed:.1f}s'
+        if not self.node:
+            return f'`{self.graph}` failed after {self.elapsed:.1f}s'
+
+        details = [f'{self.elapsed:.1f}s']
+        if self.turn is not None:
+            details.append(f'turn {self.turn}')
+        if self.retrieved is not None:
+            details.append(f'{self.retrieved} documents')
+        if self.node_elapsed is not None:
+            details.append(f'took {self.node_elapsed:.1f}s')
+        return f'`{self.graph}` {self.status} `{self.node}` ({", ".join(details)})'
+
+
+Subscriber = Callable[[list[ProgressEvent]], None]
+
+
+class ProgressBus:
+    """
+    Delivers the progress events of graph runs to its subscribers, throttled and coalesced: events arriving within
+    `min_interval` seconds of the last delivery are held back, and only the latest event of every node is delivered.
+    Held-back events are delivered by a timer once `min_interval` has passed, so that none of them waits for the
+    next event. Events closing a graph run are delivered immediately.
+    """
+
+    def __init__(self, min_interval: float = MIN_DELIVERY_INTERVAL_SECONDS) -> None:
+        self.min_interval = min_interval
+        self.subscribers: list[Subscriber] = list()
+        self._pending: dict[tuple[str, str], ProgressEvent] = dict()
+        self._last_delivery = 0.0
+        self._timer: Optional[Timer] = None
+        self._lock = Lock()
+
+    def subscribe(self, subscriber: Subscriber) -> None:
+        self.subscribers.append(subscriber)
+
+    def publish(self, event: ProgressEvent) -> None:
+        with self._lock:
+            # Coalesce: a newer event of the same node supersedes the pending one
+            self._pending.pop((event.graph, event.node), None)
+            self._pending[(event.graph, event.node)] = event
+            since_delivery = time.monotonic() - self._last_delivery
+            if event.node and since_delivery < self.min_interval:
+                if self._timer is None:
+                    # The timer delivers in the context of the publisher, e.g. the Panel document of its session
+                    self._timer = Timer(self.min_interval - since_delivery, copy_context().run, args=(self.flush,))
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+        self.flush()
+
+    def flush(self) -> None:
+        """Delivers the pending events right away."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            events = list(self._pending.values())
+            self._pending.clear()
+            self._last_delivery = time.monotonic()
+        if events:
+            for subscriber in self.subscribers:
+                subscriber(events)
+
+
+def stream_graph(graph: CompiledStateGraph, graph_input: Any, config: dict[str, Any], bus: ProgressBus,
+                 graph_name: str) -> dict[str, Any]:
+    """
+    Runs the graph, publishing the start and end of every node to the bus, and returns the final state values.
+    The events carry the interview turn, the number of retrieved documents and the elapsed time. The run closes with
+    a done event, or an error event should the graph raise, delivered right away.
+    """
+    started_at = time.perf_counter()
+    node_started_at: dict[str, float] = dict()
+    num_answers = 0
+    values: dict[str, Any] = dict()
+
+    failed = True
+    try:
+        for mode, chunk in graph.stream(graph_input, config=config, stream_mode=['debug', 'values']):
+            if mode == 'values':
+                values = chunk
+                continue
+            if chunk['type'] not in ('task', 'task_result'):
+                continue
+
+            payload = chunk['payload']
+            now = time.perf_counter()
+            event = ProgressEvent(
+                graph=graph_name,
+                node=payload['name'],
+                status=STATUS_START,
+                step=chunk.get('step', 0),
+                turn=num_answers + 1 if 'max_num_turns' in values else None,
+                elapsed=now - started_at
+            )
+
+            if chunk['type'] == 'task':
+                node_started_at[payload['id']] = now
+            else:
+                writes = dict(payload.get('result') or [])
+                if payload['name'] == 'answer_question':
+                    num_answers += 1
+                event.status = STATUS_ERROR if payload.get('error') else STATUS_END
+                event.node_elapsed = now - node_started_at.pop(payload['id'], now)
+                if isinstance(writes.get('context'), list):
+                    event.retrieved = len(writes['context'])
+            bus.publish(event)
+
+        failed = False
+    finally:
+        bus.publish(ProgressEvent(graph=graph_name, node='', status=STATUS_ERROR if failed else STATUS_DONE,
+                                  elapsed=time.perf_counter() - started_at))
+        bus.flush()
+    return values
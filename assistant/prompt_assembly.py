@@ -0,0 +1,26 @@
+from typing import Optional, Sequence
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+
+def assemble_prompt(instructions: str, *variable_parts: str, messages: Sequence[BaseMessage] = (),
+                    task: Optional[str] = None) -> list[BaseMessage]:
+    """
+    Lays a prompt out for the provider's automatic prefix caching, which reuses the longest prompt prefix
+    already seen. The static instructions come first, so they must hold no placeholders. The variable parts
+    follow, from the most to the least stable, then the conversation, and last the task of this call.
+
+    Variable parts that only grow at their end between calls, such as the documents retrieved so far, keep the
+    previous call's prompt up to their content as a prefix of the next; what follows them is not reused.
+    """
+    prompt: list[BaseMessage] = [SystemMessage(content=instructions)]
+    prompt += [SystemMessage(content=part) for part in variable_parts]
+    prompt += list(messages)
+    if task is not None:
+        prompt.append(HumanMessage(content=task))
+    return prompt
+
+
+def prompt_part(label: str, content: str) -> str:
+    """Variable part of a prompt, introduced by its label."""
+    return f'{label}:\n\n{content}'
@@ -0,0 +1,82 @@
+import os
+import time
+from collections import defaultdict, deque
+from functools import wraps
+from threading import Lock
+from typing import Callable
+
+from assistant.shared_state import shared_store
+from assistant.token_budget import count_tokens
+
+
+class LocalRateLimiter:
+    """Sliding-window rate limiter of a single process; see `SharedStore.acquire` for the semantics."""
+
+    def __init__(self) -> None:
+        self._calls: dict[str, deque] = defaultdict(deque)
+        self._lock = Lock()
+
+    def acquire(self, name: str, limit: int, period: float, weight: int = 1) -> float:
+        now = time.monotonic()
+        with self._lock:
+            calls = self._calls[name]
+            while calls and calls[0][0] <= now - period:
+                calls.popleft()
+
+            used = sum(call_weight for _, call_weight in calls)
+            if not calls or used + weight <= limit:
+                calls.append((now, weight))
+                return 0.0
+
+            for called_at, call_weight in calls:
+                used -= call_weight
+                if used + weight <= limit:
+                    return max(called_at + period - now, 0.01)
+            return max(calls[-1][0] + period - now, 0.01)
+
+
+# AGENTCRAFT_RATE_LIMITS=off lifts all limits, e.g. for load tests against fake backends
+RATE_LIMITS_ENABLED = os.getenv('AGENTCRAFT_RATE_LIMITS', 'on') != 'off'
+
+# With a shared state backend the budget is shared by all serving processes and replicas, instead of multiplied
+rate_limiter = shared_store if shared_store is not None else LocalRateLimiter()
+
+
+def wait_for(name: str, limit: int, period: float, weight: int = 1) -> None:
+    """Blocks until the rate limiter `name` admits a call of the given weight."""
+    while RATE_LIMITS_ENABLED:
+        wait = rate_limiter.acquire(name, limit, period, weight)
+        if not wait:
+            return
+        time.sleep(wait)
+
+
+def rate_limited(name: str, calls: int, period: float) -> Callable:
+    """Decorator limiting the function to `calls` per `period` seconds, waiting for a free slot when exhausted."""
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            wait_for(name, calls, period)
+            return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def tokens_limited(name: str, tokens_per_minute: int) -> Callable:
+    """
+    Decorator of LLM client functions taking the prompt as first argument: waits until the prompt's tokens fit
+    into the tokens-per-minute budget `name`, which is shared by all the functions calling the same provider.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(messages, *args, **kwargs):
+            wait_for(name, tokens_per_minute, 60, weight=count_tokens(messages))
+            return func(messages, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,134 @@
+import json
+import os
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+from assistant.database import POSTGRES, SQLITE, SqlStore, get_db_connection, sqlite_connection_factory
+from assistant.inf_graph_schema import Analyst
+from assistant.text_similarity import STOP_WORDS, cosine_similarity, tokenize
+
+# Prior research at least this similar to a new topic is offered for reuse
+REUSE_SIMILARITY = 0.6
+# Number of full-text matches re-ranked by the local similarity
+MAX_CANDIDATES = 20
+
+DDL = {
+    POSTGRES: [
+        """CREATE TABLE IF NOT EXISTS research (
+            research_id SERIAL PRIMARY KEY,
+            topic TEXT NOT NULL,
+            analysts TEXT NOT NULL,
+            sections TEXT NOT NULL,
+            final_report TEXT NOT NULL,
+            citations TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            search_vector TSVECTOR GENERATED ALWAYS AS (to_tsvector('english', topic || ' ' || final_report)) STORED
+        )""",
+        'CREATE INDEX IF NOT EXISTS research_search_vector_idx ON research USING GIN (search_vector)',
+    ],
+    SQLITE: [
+        """CREATE TABLE IF NOT EXISTS research (
+            research_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic TEXT NOT NULL,
+            analysts TEXT NOT NULL,
+            sections TEXT NOT NULL,
+            final_report TEXT NOT NULL,
+            citations TEXT NOT NULL,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )""",
+        'CREATE VIRTUAL TABLE IF NOT EXISTS research_fts USING fts5(topic, final_report)',
+    ],
+}
+
+COLUMNS = 'research_id, topic, analysts, sections, final_report, citations'
+
+
+class ResearchRecord(BaseModel):
+    research_id: Optional[int] = Field(default=None, description='Id of the record in the research store.')
+    topic: str = Field(description='Research question the record answers.')
+    analysts: list[Analyst] = Field(description='Analyst Personas of the research.')
+    sections: list[str] = Field(description='Report section of each analyst, aligned with `analysts`.')
+    final_report: str = Field(default='', description='Final report of the research.')
+    citations: dict[str, str] = Field(default_factory=dict, description='Labels of the citation ids in the sections.')
+    similarity: float = Field(default=0.0, description='Similarity to the looked-up topic.')
+
+
+class ResearchStore(SqlStore):
+    """
+    Persistent index of past research: personas, report sections and final reports.
+
+    Candidates are pre-selected with the full-text search of the database and re-ranked by a local
+    similarity of their topic to the new one.
+    """
+
+    ddl = DDL
+
+    def save(self, record: ResearchRecord) -> int:
+        """Stores the record and returns its research id."""
+        params = (
+            record.topic,
+            json.dumps([analyst.model_dump() for analyst in record.analysts]),
+            json.dumps(record.sections),
+            record.final_report,
+            json.dumps(record.citations),
+        )
+        with self.transaction() as cursor:
+            cursor.execute(self.sql(
+                'INSERT INTO research (topic, analysts, sections, final_report, citations) '
+                'VALUES (?, ?, ?, ?, ?) RETURNING research_id'
+            ), params)
+            research_id = cursor.fetchone()[0]
+
+            if self.dialect == SQLITE:
+                cursor.execute('INSERT INTO research_fts (rowid, topic, final_report) VALUES (?, ?, ?)',
+                               (research_id, record.topic, record.final_report))
+        return research_id
+
+    def find_similar(self, topic: str, min_similarity: float = REUSE_SIMILARITY) -> list[ResearchRecord]:
+        """Past research with a topic at least `min_similarity` similar to the given one, most similar first."""
+        terms = sorted({token for token in tokenize(topic) if token not in STOP_WORDS})
+        if not terms:
+            return []
+
+        if self.dialect == POSTGRES:
+            rows = self.execute(
+                f"""SELECT {COLUMNS} FROM research WHERE search_vector @@ to_tsquery('english', ?)
+                    ORDER BY ts_rank(search_vector, to_tsquery('english', ?)) DESC LIMIT ?""",
+                (' | '.join(terms), ' | '.join(terms), MAX_CANDIDATES)
+            )
+        else:
+            rows = self.execute(
+                """SELECT r.research_id, r.topic, r.analysts, r.sections, r.final_report, r.citations
+                    FROM research_fts f JOIN research r ON r.research_id = f.rowid
+                    WHERE research_fts MATCH ? ORDER BY bm25(research_fts) LIMIT ?""",
+                (' OR '.join(f'"{term}"' for term in terms), MAX_CANDIDATES)
+            )
+
+        records = list()
+        for research_id, stored_topic, analysts, sections, final_report, citations in rows:
+            similarity = cosine_similarity(topic, stored_topic)
+            if similarity < min_similarity:
+                continue
+            records.append(ResearchRecord(
+                research_id=research_id,
+                topic=stored_topic,
+                analysts=[Analyst(**analyst) for analyst in json.loads(analysts)],
+                sections=json.loads(sections),
+                final_report=final_report,
+                citations=json.loads(citations),
+                similarity=similarity,
+            ))
+        return sorted(records, key=lambda record: record.similarity, reverse=True)
+
+
+def create_research_store() -> ResearchStore:
+    """
+    Creates the research store on PostgreSQL when AGENTCRAFT_RESEARCH_DB=postgres, using the connection
+    settings of `assistant.database`, and on a local SQLite file (AGENTCRAFT_RESEARCH_SQLITE) otherwise.
+    """
+    if os.getenv('AGENTCRAFT_RESEARCH_DB', SQLITE) == POSTGRES:
+        return ResearchStore(get_db_connection, POSTGRES)
+
+    fqfp_db = os.getenv('AGENTCRAFT_RESEARCH_SQLITE', 'research.sqlite3')
+    return ResearchStore(sqlite_connection_factory(fqfp_db), SQLITE)
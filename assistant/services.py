@@ -1,29 +1,43 @@
 import os
 
+from langchain_community.document_loaders import WikipediaLoader
 from langchain_community.tools.tavily_search import TavilySearchResults
+from langchain_core.documents import Document
 from langchain_openai import ChatOpenAI
-from ratelimit import limits, sleep_and_retry
 
+from assistant.cassette import recorded
+from assistant.fake_backends import FakeChatModel, FakeTavilySearch, FakeWikipediaLoader, fake_backends_enabled
 from assistant.inf_graph_schema import Perspectives, SearchQuery
+from assistant.rate_limiter import rate_limited, tokens_limited
+from assistant.token_budget import TOKENS_PER_MINUTE, token_budgeted
 from utils.fs_utils import load_api_key
 
-os.environ['OPENAI_API_KEY'] = load_api_key('openai.api_key')
-os.environ['LANGCHAIN_TRACING_V2'] = 'true'
-os.environ['LANGCHAIN_API_KEY'] = load_api_key('langchain.api_key')
-os.environ['LANGCHAIN_PROJECT'] = 'langchain-academy'
-os.environ['TAVILY_API_KEY'] = load_api_key('tavily.api_key')
+if fake_backends_enabled():
+    # Canned backends without network access or API keys, e.g. for load tests
+    tavily_search = FakeTavilySearch()
+    wikipedia_loader = FakeWikipediaLoader
+    llm_4o_mini = llm_3_5_turbo = llm_o1_mini = FakeChatModel()
+else:
+    os.environ['OPENAI_API_KEY'] = load_api_key('openai.api_key')
+    os.environ['LANGCHAIN_TRACING_V2'] = 'true'
+    os.environ['LANGCHAIN_API_KEY'] = load_api_key('langchain.api_key')
+    os.environ['LANGCHAIN_PROJECT'] = 'langchain-academy'
+    os.environ['TAVILY_API_KEY'] = load_api_key('tavily.api_key')
 
-# Web search tool
-tavily_search = TavilySearchResults(max_results=3)
+    # Web search tool
+    tavily_search = TavilySearchResults(max_results=3)
+    wikipedia_loader = WikipediaLoader
 
-# LLM models
-llm_4o_mini = ChatOpenAI(model='gpt-4o-mini', temperature=0)
-llm_3_5_turbo = ChatOpenAI(model='gpt-3.5-turbo', temperature=0)
-llm_o1_mini = ChatOpenAI(model='o1-mini', temperature=0)
+    # LLM models
+    llm_4o_mini = ChatOpenAI(model='gpt-4o-mini', temperature=0)
+    llm_3_5_turbo = ChatOpenAI(model='gpt-3.5-turbo', temperature=0)
+    llm_o1_mini = ChatOpenAI(model='o1-mini', temperature=0)
 
 
-@sleep_and_retry  # Automatically retries after waiting
-@limits(calls=3, period=60)  # Limits to 3 calls per minute
+@token_budgeted()
+@recorded('openai')
+@tokens_limited('openai_tokens', TOKENS_PER_MINUTE)
+@rate_limited('openai', calls=3, period=60)  # Limits to 3 calls per minute, waiting for a free slot
 def safe_invoke(*args, **kwargs):
     return llm_4o_mini.invoke(*args, **kwargs)
 
@@ -31,13 +45,34 @@ def safe_invoke(*args, **kwargs):
 structured_perspective_llm = llm_4o_mini.with_structured_output(Perspectives)
 structured_searchquery_llm = llm_4o_mini.with_structured_output(SearchQuery)
 
-@sleep_and_retry
-@limits(calls=3, period=60)
+@token_budgeted()
+@recorded('openai_perspective')
+@tokens_limited('openai_tokens', TOKENS_PER_MINUTE)
+@rate_limited('openai_perspective', calls=3, period=60)
 def safe_invoke_perspective(*args, **kwargs):
     return structured_perspective_llm.invoke(*args, **kwargs)
 
 
-@sleep_and_retry
-@limits(calls=3, period=60)
+@token_budgeted()
+@recorded('openai_searchquery')
+@tokens_limited('openai_tokens', TOKENS_PER_MINUTE)
+@rate_limited('openai_searchquery', calls=3, period=60)
 def safe_invoke_searchquery(*args, **kwargs):
     return structured_searchquery_llm.invoke(*args, **kwargs)
+
+
+@token_budgeted()
+@recorded('openai_searchquery')
+@tokens_limited('openai_tokens', TOKENS_PER_MINUTE)
+def invoke_searchquery(*args, **kwargs):
+    return structured_searchquery_llm.invoke(*args, **kwargs)
+
+
+@recorded('tavily')
+def search_tavily(query: str) -> list[dict]:
+    return tavily_search.invoke(query)
+
+
+@recorded('wikipedia')
+def load_wikipedia(query: str, load_max_docs: int = 2) -> list[Document]:
+    return wikipedia_loader(query=query, load_max_docs=load_max_docs).load()
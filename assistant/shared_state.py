@@ -0,0 +1,136 @@
+import os
+import sqlite3
+import time
+from typing import Optional
+
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.memory import MemorySaver
+
+from assistant.database import POSTGRES, SQLITE, SqlStore, get_db_conninfo, get_db_connection, sqlite_connection_factory
+
+MEMORY = 'memory'
+
+DDL = {
+    POSTGRES: [
+        """CREATE TABLE IF NOT EXISTS shared_kv (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (namespace, key)
+        )""",
+        """CREATE TABLE IF NOT EXISTS rate_limit_calls (
+            name TEXT NOT NULL,
+            called_at DOUBLE PRECISION NOT NULL,
+            weight INTEGER NOT NULL
+        )""",
+        'CREATE INDEX IF NOT EXISTS rate_limit_calls_idx ON rate_limit_calls (name, called_at)',
+    ],
+    SQLITE: [
+        """CREATE TABLE IF NOT EXISTS shared_kv (
+            namespace TEXT NOT NULL,
+            key TEXT NOT NULL,
+            value TEXT NOT NULL,
+            PRIMARY KEY (namespace, key)
+        )""",
+        """CREATE TABLE IF NOT EXISTS rate_limit_calls (
+            name TEXT NOT NULL,
+            called_at REAL NOT NULL,
+            weight INTEGER NOT NULL
+        )""",
+        'CREATE INDEX IF NOT EXISTS rate_limit_calls_idx ON rate_limit_calls (name, called_at)',
+    ],
+}
+
+
+def shared_state_backend() -> str:
+    """Backend of the state shared by all serving processes: AGENTCRAFT_SHARED_STATE = memory | sqlite | postgres."""
+    return os.getenv('AGENTCRAFT_SHARED_STATE', MEMORY)
+
+
+def shared_state_sqlite() -> str:
+    return os.getenv('AGENTCRAFT_SHARED_STATE_SQLITE', 'shared_state.sqlite3')
+
+
+class SharedStore(SqlStore):
+    """
+    State shared by all serving processes and replicas: a key-value cache and the call log of the rate limiter.
+    """
+
+    ddl = DDL
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        rows = self.execute('SELECT value FROM shared_kv WHERE namespace = ? AND key = ?', (namespace, key))
+        return rows[0][0] if rows else None
+
+    def put(self, namespace: str, key: str, value: str) -> str:
+        """Stores the value, unless the key is already present. Returns the value stored under the key."""
+        with self.transaction() as cursor:
+            cursor.execute(self.sql(
+                'INSERT INTO shared_kv (namespace, key, value) VALUES (?, ?, ?) ON CONFLICT (namespace, key) DO NOTHING'
+            ), (namespace, key, value))
+            cursor.execute(self.sql('SELECT value FROM shared_kv WHERE namespace = ? AND key = ?'), (namespace, key))
+            return cursor.fetchone()[0]
+
+    def acquire(self, name: str, limit: int, period: float, weight: int = 1) -> float:
+        """
+        Sliding-window rate limiter: records a call of the given weight if the calls of the last `period` seconds
+        leave room for it, and returns 0. Otherwise returns the number of seconds to wait before trying again.
+        """
+        now = time.time()
+        with self.transaction() as cursor:
+            if self.dialect == POSTGRES:
+                # Serialize the limiter of this name across connections; SQLite transactions are serialized already
+                cursor.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', (name,))
+
+            cursor.execute(self.sql('DELETE FROM rate_limit_calls WHERE name = ? AND called_at <= ?'),
+                           (name, now - period))
+            cursor.execute(self.sql('SELECT called_at, weight FROM rate_limit_calls WHERE name = ? ORDER BY called_at'),
+                           (name,))
+            calls = cursor.fetchall()
+
+            used = sum(call_weight for _, call_weight in calls)
+            if not calls or used + weight <= limit:
+                cursor.execute(self.sql('INSERT INTO rate_limit_calls (name, called_at, weight) VALUES (?, ?, ?)'),
+                               (name, now, weight))
+                return 0.0
+
+            # Wait until enough of the oldest calls have left the window
+            for called_at, call_weight in calls:
+                used -= call_weight
+                if used + weight <= limit:
+                    return max(called_at + period - now, 0.01)
+            return max(calls[-1][0] + period - now, 0.01)
+
+
+def create_shared_store() -> Optional[SharedStore]:
+    backend = shared_state_backend()
+    if backend == POSTGRES:
+        return SharedStore(get_db_connection, POSTGRES)
+    if backend == SQLITE:
+        return SharedStore(sqlite_connection_factory(shared_state_sqlite()), SQLITE)
+    return None
+
+
+def create_checkpointer() -> BaseCheckpointSaver:
+    """
+    Checkpointer of the graphs. With a shared backend every serving process sees the checkpoints of every session,
+    so that a session reconnecting to another process resumes where it left off.
+    """
+    backend = shared_state_backend()
+    if backend == POSTGRES:
+        from langgraph.checkpoint.postgres import PostgresSaver
+        from psycopg import Connection
+        from psycopg.rows import dict_row
+
+        conn = Connection.connect(get_db_conninfo(), autocommit=True, prepare_threshold=0, row_factory=dict_row)
+        checkpointer = PostgresSaver(conn)
+        checkpointer.setup()
+        return checkpointer
+    if backend == SQLITE:
+        from langgraph.checkpoint.sqlite import SqliteSaver
+
+        return SqliteSaver(sqlite3.connect(shared_state_sqlite(), check_same_thread=False, timeout=30))
+    return MemorySaver()
+
+
+shared_store = create_shared_store()
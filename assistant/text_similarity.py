@@ -0,0 +1,56 @@
+import math
+import re
+from collections import Counter
+from typing import Iterable, Set, Tuple
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+SOURCE_PATTERN = re.compile(r'<Document (?:id|href|source)="([^"]*)"')
+STOP_WORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'in', 'is', 'it', 'its', 'of', 'on',
+    'or', 'that', 'the', 'their', 'this', 'to', 'was', 'were', 'which', 'who', 'with',
+}
+
+
+def tokenize(text: str) -> list[str]:
+    """Lower-cases the text and splits it into alphanumeric word tokens."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+def ngrams(text: str, n: int = 3) -> Set[Tuple[str, ...]]:
+    """Returns the set of word n-grams of the text. Texts shorter than `n` words yield their single token tuple."""
+    tokens = tokenize(text)
+    if len(tokens) < n:
+        return {tuple(tokens)} if tokens else set()
+    return {tuple(tokens[i:i + n]) for i in range(len(tokens) - n + 1)}
+
+
+def extract_sources(text: str) -> Set[str]:
+    """Returns the set of source ids or URLs referenced by the `<Document .../>` tags of the text."""
+    return set(SOURCE_PATTERN.findall(text))
+
+
+def jaccard(a: Iterable, b: Iterable) -> float:
+    """Jaccard similarity of two collections, treated as sets. Two empty collections are considered identical."""
+    a, b = set(a), set(b)
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def novelty(new: Set, seen: Set) -> float:
+    """Share of the `new` items that are absent from `seen`. An empty `new` set carries no novelty."""
+    if not new:
+        return 0.0
+    return len(new - seen) / len(new)
+
+
+def cosine_similarity(a: str, b: str) -> float:
+    """Cosine similarity of the word unigram and bigram frequencies of two texts, ignoring stop words."""
+    def _terms(text: str) -> Counter:
+        tokens = [token for token in tokenize(text) if token not in STOP_WORDS]
+        return Counter(tokens + [f'{x} {y}' for x, y in zip(tokens, tokens[1:])])
+
+    terms_a, terms_b = _terms(a), _terms(b)
+    dot_product = sum(count * terms_b[term] for term, count in terms_a.items())
+    norm = math.sqrt(sum(c * c for c in terms_a.values())) * math.sqrt(sum(c * c for c in terms_b.values()))
+    return dot_product / norm if norm else 0.0
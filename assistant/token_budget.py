@@ -0,0 +1,220 @@
+import json
+import math
+import os
+import warnings
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache, wraps
+from threading import Lock
+from typing import Any, Callable, Iterator, Optional
+
+import tiktoken
+from langchain_core.messages import AIMessage, BaseMessage, SystemMessage, convert_to_messages
+from pydantic import BaseModel
+
+MODEL = 'gpt-4o-mini'
+
+# USD per million input, cached input and output tokens
+MODEL_PRICES = {
+    'gpt-4o-mini': (0.15, 0.075, 0.60),
+    'gpt-3.5-turbo': (0.50, 0.50, 1.50),
+    'o1-mini': (1.10, 0.55, 4.40),
+}
+
+MAX_PROMPT_TOKENS = int(os.getenv('AGENTCRAFT_MAX_PROMPT_TOKENS', '16000'))
+MAX_RUN_TOKENS = int(os.getenv('AGENTCRAFT_MAX_RUN_TOKENS', '500000'))
+MAX_RUN_COST_USD = float(os.getenv('AGENTCRAFT_MAX_RUN_COST_USD', '1.0'))
+TOKENS_PER_MINUTE = int(os.getenv('AGENTCRAFT_TOKENS_PER_MINUTE', '200000'))
+
+# Completion tokens accounted for when checking, before a call, whether the run can still afford it
+RESERVED_COMPLETION_TOKENS = 1000
+
+# Characters per token of English text, for estimating tokens without the tokenizer
+CHARS_PER_TOKEN = 4
+
+
+class TokenBudgetExceeded(RuntimeError):
+    """Raised before a call whose prompt, or whose run, would exceed its token or cost budget."""
+
+
+@lru_cache
+def _encoding(model: str) -> Optional[tiktoken.Encoding]:
+    """
+    The tokenizer of the model, or None if it cannot be loaded: tiktoken downloads its BPE files on first use,
+    unless cached under TIKTOKEN_CACHE_DIR, so offline hosts estimate the tokens from the characters instead.
+    """
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding('o200k_base')
+    except Exception as e:
+        warnings.warn(f'Estimating tokens as {CHARS_PER_TOKEN} characters each, tiktoken is unavailable: {e!r}')
+        return None
+
+
+def _text_tokens(text: str, encoding: Optional[tiktoken.Encoding]) -> int:
+    if encoding is None:
+        return math.ceil(len(text) / CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _message_tokens(message: BaseMessage, encoding: Optional[tiktoken.Encoding]) -> int:
+    content = message.content if isinstance(message.content, str) else json.dumps(message.content)
+    # Every message is wrapped in <|start|>{role}<|message|>...<|end|>
+    num_tokens = 3 + _text_tokens(content, encoding)
+    if message.name:
+        num_tokens += 1
+    return num_tokens
+
+
+def count_tokens(messages: Any, model: str = MODEL) -> int:
+    """Estimates, locally, the prompt tokens of a message list or a single prompt in the chat format of OpenAI."""
+    encoding = _encoding(model)
+    messages = convert_to_messages(messages if isinstance(messages, list) else [messages])
+    # Every reply is primed with <|start|>assistant<|message|>
+    return 3 + sum(_message_tokens(message, encoding) for message in messages)
+
+
+def cost(input_tokens: int, output_tokens: int, model: str = MODEL, cached_tokens: int = 0) -> float:
+    """Cost in USD of a call; `cached_tokens` of the input tokens were served from the provider's prompt cache."""
+    input_price, cached_price, output_price = MODEL_PRICES.get(model, MODEL_PRICES[MODEL])
+    return ((input_tokens - cached_tokens) * input_price + cached_tokens * cached_price
+            + output_tokens * output_price) / 1_000_000
+
+
+def fit_prompt(messages: Any, max_tokens: int = MAX_PROMPT_TOKENS, model: str = MODEL) -> tuple[Any, int]:
+    """
+    Trims the oldest conversation messages until the prompt fits into `max_tokens`, and returns it with its tokens.
+    System messages and the last message are kept; a prompt exceeding the budget without any other message
+    raises `TokenBudgetExceeded`.
+    """
+    num_tokens = count_tokens(messages, model)
+    if num_tokens <= max_tokens:
+        return messages, num_tokens
+
+    if isinstance(messages, list):
+        messages = convert_to_messages(messages)
+        trimmable = [i for i, message in enumerate(messages[:-1]) if not isinstance(message, SystemMessage)]
+        encoding = _encoding(model)
+        dropped = set()
+        for i in trimmable:
+            if num_tokens <= max_tokens:
+                break
+            dropped.add(i)
+            num_tokens -= _message_tokens(messages[i], encoding)
+        messages = [message for i, message in enumerate(messages) if i not in dropped]
+
+    if num_tokens > max_tokens:
+        raise TokenBudgetExceeded(f'Prompt of {num_tokens} tokens exceeds the limit of {max_tokens} tokens per call')
+    return messages, num_tokens
+
+
+class RunBudget:
+    """Token and cost budget of a research run, shared by all the calls of its graph runs."""
+
+    def __init__(self, max_tokens: int = MAX_RUN_TOKENS, max_cost: float = MAX_RUN_COST_USD) -> None:
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cached_tokens = 0
+        self.cost = 0.0
+        self._lock = Lock()
+
+    @property
+    def tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def check(self, prompt_tokens: int, model: str = MODEL) -> None:
+        """Raises `TokenBudgetExceeded` if the run cannot afford a call with the given prompt."""
+        with self._lock:
+            if self.tokens + prompt_tokens > self.max_tokens:
+                raise TokenBudgetExceeded(
+                    f'Run budget of {self.max_tokens} tokens exhausted: {self.tokens} used, {prompt_tokens} requested'
+                )
+            projected_cost = self.cost + cost(prompt_tokens, RESERVED_COMPLETION_TOKENS, model)
+            if projected_cost > self.max_cost:
+                raise TokenBudgetExceeded(
+                    f'Run budget of ${self.max_cost:.2f} exhausted: ${self.cost:.4f} used, '
+                    f'${projected_cost - self.cost:.4f} requested'
+                )
+
+    def record(self, input_tokens: int, output_tokens: int, call_cost: float, cached_tokens: int = 0) -> None:
+        with self._lock:
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+            self.cached_tokens += cached_tokens
+            self.cost += call_cost
+
+    def usage(self) -> dict[str, Any]:
+        return {
+            'input_tokens': self.input_tokens,
+            'output_tokens': self.output_tokens,
+            'cached_tokens': self.cached_tokens,
+            'cost': self.cost
+        }
+
+    def remaining(self, parts: int = 1) -> dict[str, Any]:
+        """
+        Arguments of a budget limited to what is left of this one, e.g. for a job run by a worker. With `parts`,
+        the budget of each of as many jobs run in parallel, which together cannot spend more than what is left.
+        """
+        parts = max(parts, 1)
+        with self._lock:
+            return {
+                'max_tokens': max(self.max_tokens - self.tokens, 0) // parts,
+                'max_cost': max(self.max_cost - self.cost, 0.0) / parts
+            }
+
+
+current_run_budget: ContextVar[Optional[RunBudget]] = ContextVar('current_run_budget', default=None)
+
+
+@contextmanager
+def use_run_budget(budget: RunBudget) -> Iterator[RunBudget]:
+    """Charges the calls made within the block to the budget."""
+    token = current_run_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        current_run_budget.reset(token)
+
+
+def _usage(response: Any, prompt_tokens: int, model: str) -> tuple[int, int, int]:
+    """
+    Input, output and cached input tokens of a call: reported by the provider, or estimated for structured outputs.
+    """
+    if isinstance(response, AIMessage) and response.usage_metadata:
+        usage_metadata = response.usage_metadata
+        cached_tokens = (usage_metadata.get('input_token_details') or {}).get('cache_read') or 0
+        return usage_metadata['input_tokens'], usage_metadata['output_tokens'], cached_tokens
+    completion = response.model_dump_json() if isinstance(response, BaseModel) else str(response)
+    return prompt_tokens, count_tokens(completion, model) - 3, 0
+
+
+def token_budgeted(model: str = MODEL, max_prompt_tokens: int = MAX_PROMPT_TOKENS) -> Callable:
+    """
+    Decorator of LLM client functions taking the prompt as first argument: fits the prompt into the per-call
+    budget and charges the call to the current run budget, if any, rejecting it when the run cannot afford it.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def wrapper(messages, *args, **kwargs):
+            messages, prompt_tokens = fit_prompt(messages, max_prompt_tokens, model)
+            budget = current_run_budget.get()
+            if budget is not None:
+                budget.check(prompt_tokens, model)
+
+            response = func(messages, *args, **kwargs)
+
+            if budget is not None:
+                input_tokens, output_tokens, cached_tokens = _usage(response, prompt_tokens, model)
+                budget.record(input_tokens, output_tokens, cost(input_tokens, output_tokens, model, cached_tokens),
+                              cached_tokens)
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,176 @@
+import argparse
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from functools import partial
+from typing import Any, Callable, Iterator
+
+from langchain_core.messages import HumanMessage
+from langgraph.graph.state import CompiledStateGraph
+
+from assistant.cassette import use_cassette
+from assistant.citations import citation_registry
+from assistant.inf_graph_schema import Analyst, ResearchGraphState
+from assistant.job_queue import (JOB_INTERVIEW, JOB_LEASE_SECONDS, JOB_PERSONAS, JOB_REPORT, Job, JobQueue,
+                                  create_job_queue)
+from assistant.profiling import profile_run
+from assistant.progress import ProgressBus, ProgressEvent, stream_graph
+from assistant.token_budget import RunBudget, use_run_budget
+
+POLL_INTERVAL_SECONDS = 1.0
+# Several heartbeats per lease, so that a slow database round trip does not lose the lease
+HEARTBEAT_INTERVAL_SECONDS = JOB_LEASE_SECONDS / 10
+
+Publish = Callable[[dict[str, Any]], None]
+
+
+def run_graph(graph: CompiledStateGraph, graph_input: dict[str, Any], publish: Publish,
+              graph_name: str, thread_id: str = None) -> dict[str, Any]:
+    """
+    Runs the graph in the given thread, by default a fresh one, and returns the final state values. Node progress
+    events are coalesced by a bus before being published, which keeps the writes to the job queue down.
+    """
+    config = {'configurable': {'thread_id': thread_id or f'job-{uuid.uuid4().hex}'}}
+    bus = ProgressBus()
+
+    def publish_events(events: list[ProgressEvent]) -> None:
+        for event in events:
+            publish(event.model_dump())
+
+    bus.subscribe(publish_events)
+    return stream_graph(graph, graph_input, config, bus, graph_name)
+
+
+# The graphs are imported by the jobs, within the worker processes: importing a graph opens the database
+# connection of its checkpointer, which must not be shared with the parent or the other workers
+def run_personas_job(payload: dict[str, Any], publish: Publish) -> dict[str, Any]:
+    from assistant.inf_graph_analyst_persona import graph as graph_analyst_persona
+
+    state = run_graph(graph_analyst_persona, {
+        'topic': payload['topic'],
+        'max_analysts': payload['max_analysts'],
+        'analysts': [Analyst(**analyst) for analyst in payload.get('analysts', [])],
+        'human_analyst_feedback': payload.get('human_analyst_feedback'),
+    }, publish, 'analyst_personas', payload.get('thread_id'))
+    return {'analysts': [analyst.model_dump() for analyst in state.get('analysts', [])]}
+
+
+def run_interview_job(payload: dict[str, Any], publish: Publish) -> dict[str, Any]:
+    from assistant.inf_graph_interview import graph as graph_interview
+
+    state = run_graph(graph_interview, {
+        'analyst': Analyst(**payload['analyst']),
+        'messages': [HumanMessage(payload['question'])],
+        'max_num_turns': payload.get('max_num_turns', 2),
+    }, publish, 'interview')
+
+    # Citation ids are resolved by the UI process, so the labels travel along with the sections
+    sections = state.get('sections', [])
+    return {'sections': sections, 'citations': citation_registry.export(sections)}
+
+
+def run_report_job(payload: dict[str, Any], publish: Publish) -> dict[str, Any]:
+    from assistant.inf_graph_tech_report import graph as graph_tech_report
+
+    citation_registry.update(payload.get('citations', {}))
+    analysts = [Analyst(**analyst) for analyst in payload['analysts']]
+    state = run_graph(graph_tech_report, ResearchGraphState(
+        topic=payload['topic'],
+        max_analysts=len(analysts),
+        human_analyst_feedback=None,
+        analysts=analysts,
+        sections=payload['sections'],
+        introduction='',
+        content='',
+        conclusion='',
+        final_report=''
+    ), publish, 'tech_report', payload.get('thread_id'))
+    return {'final_report': state.get('final_report', '')}
+
+
+JOB_HANDLERS: dict[str, Callable[[dict[str, Any], Publish], dict[str, Any]]] = {
+    JOB_PERSONAS: run_personas_job,
+    JOB_INTERVIEW: run_interview_job,
+    JOB_REPORT: run_report_job,
+}
+
+
+@contextmanager
+def keep_lease(job_queue: JobQueue, job: Job, worker_name: str) -> Iterator[None]:
+    """Sends heartbeats for the job from a background thread while the block runs, until the lease is lost."""
+    stop = threading.Event()
+
+    def send_heartbeats() -> None:
+        while not stop.wait(HEARTBEAT_INTERVAL_SECONDS):
+            if not job_queue.heartbeat(job.job_id, worker_name):
+                return
+
+    thread = threading.Thread(target=send_heartbeats, name=f'heartbeat-{job.job_id}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_worker(job_queue: JobQueue, worker_name: str = None) -> None:
+    """
+    Claims and runs jobs from the queue, forever. Should the lease of a job be taken over by another worker,
+    its events and result are dropped: `publish`, `complete` and `fail` only apply to the holder of the lease.
+    """
+    worker_name = worker_name or f'{socket.gethostname()}-{os.getpid()}'
+    while True:
+        job = job_queue.claim(worker_name)
+        if job is None:
+            time.sleep(POLL_INTERVAL_SECONDS)
+            continue
+
+        budget = RunBudget(**job.payload.get('run_budget', {}))
+        profile = job.payload.get('profile', False)
+        # The UI names the cassette like the one of an in-process run, so that a recorded session replays either way
+        cassette = job.payload.get('cassette') or f'job-{job.job_id}/{job.kind}'
+        try:
+            with keep_lease(job_queue, job, worker_name), use_cassette(cassette), use_run_budget(budget), \
+                    profile_run(f'job-{job.job_id}', job.kind, enabled=profile):
+                result = JOB_HANDLERS[job.kind](
+                    job.payload, partial(job_queue.publish, job.job_id, worker_name)
+                )
+        except Exception:
+            # What the job spent before failing counts against the run budget all the same
+            job_queue.fail(job.job_id, worker_name, traceback.format_exc(), {'usage': budget.usage()})
+        else:
+            job_queue.complete(job.job_id, worker_name, {**result, 'usage': budget.usage()})
+
+
+def _worker_process() -> None:
+    run_worker(create_job_queue())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Pool of worker processes running the graph jobs of the job queue.')
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help='number of worker processes')
+    args = parser.parse_args()
+
+    if create_job_queue() is None:
+        parser.error('set AGENTCRAFT_JOB_QUEUE to postgres or sqlite')
+
+    # Spawned rather than forked, so that no worker inherits a connection, lock or thread of this process
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(target=_worker_process, name=f'worker-{i}', daemon=True)
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    main()
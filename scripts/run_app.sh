@@ -4,4 +4,12 @@
 cd "$(dirname "$0")/.." || exit 1
 
 # Start Panel UI from app_runner
-panel serve app_runner.py --port 5006 --allow-websocket-origin="*"
+# PANEL_NUM_PROCS > 1 forks that many serving processes; they share checkpoints, rate limits and caches
+# through AGENTCRAFT_SHARED_STATE (sqlite for a single host, postgres for multiple replicas), and the documents
+# and transcripts of the sessions through AGENTCRAFT_BLOB_DIR (default blobs/, required with postgres)
+NUM_PROCS="${PANEL_NUM_PROCS:-1}"
+if [ "$NUM_PROCS" -gt 1 ] && [ "${AGENTCRAFT_SHARED_STATE:-memory}" = "memory" ]; then
+    echo "PANEL_NUM_PROCS > 1 requires AGENTCRAFT_SHARED_STATE to be sqlite or postgres" >&2
+    exit 1
+fi
+panel serve app_runner.py --port 5006 --allow-websocket-origin="*" --num-procs "$NUM_PROCS"
@@ -0,0 +1,7 @@
+#!/bin/env sh
+
+# Navigate to project root
+cd "$(dirname "$0")/.." || exit 1
+
+# Drive concurrent dashboard sessions against fake LLM and search backends, e.g. --sessions 20 --output load.json
+python -m assistant.load_test "$@"
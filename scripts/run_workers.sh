@@ -0,0 +1,8 @@
+#!/bin/env sh
+
+# Navigate to project root
+cd "$(dirname "$0")/.." || exit 1
+
+# Start the pool of graph workers; AGENTCRAFT_JOB_QUEUE, AGENTCRAFT_SHARED_STATE and AGENTCRAFT_BLOB_DIR
+# must name the same queue, checkpoints and blobs as the Panel UI
+python -m assistant.worker --processes "${NUM_WORKERS:-4}"
@@ -0,0 +1,54 @@
+import pytest
+
+from assistant.blob_store import DEFAULT_BLOB_DIR, FileBlobStore, MemoryBlobStore, create_blob_store
+
+
+def test_memory_store_evicts_the_least_recently_used():
+    store = MemoryBlobStore(max_bytes=10)
+    first, second = store.put('aaaa'), store.put('bbbb')
+    assert store.get(first) == 'aaaa'
+
+    third = store.put('cccc')
+    assert store.get(first) == 'aaaa'
+    assert store.get(third) == 'cccc'
+    with pytest.raises(KeyError):
+        store.get(second)
+
+
+def test_memory_store_keeps_a_blob_larger_than_the_cap():
+    store = MemoryBlobStore(max_bytes=2)
+    first = store.put('aaaa')
+    second = store.put('bbbb')
+    assert store.get(second) == 'bbbb'
+    assert not store.exists(first)
+
+
+@pytest.fixture
+def environment(monkeypatch):
+    for name in ('AGENTCRAFT_BLOB_DIR', 'AGENTCRAFT_SHARED_STATE', 'AGENTCRAFT_JOB_QUEUE', 'PANEL_NUM_PROCS'):
+        monkeypatch.delenv(name, raising=False)
+    return monkeypatch
+
+
+def test_single_process_keeps_blobs_in_memory(environment):
+    assert isinstance(create_blob_store(), MemoryBlobStore)
+
+
+@pytest.mark.parametrize('name, value', [
+    ('AGENTCRAFT_SHARED_STATE', 'sqlite'),
+    ('AGENTCRAFT_JOB_QUEUE', 'sqlite'),
+    ('PANEL_NUM_PROCS', '4'),
+])
+def test_shared_state_defaults_to_a_blob_dir(environment, name, value):
+    environment.setenv(name, value)
+    store = create_blob_store()
+    assert isinstance(store, FileBlobStore) and store.root_dir == DEFAULT_BLOB_DIR
+
+
+def test_postgres_requires_a_blob_dir(environment, tmp_path):
+    environment.setenv('AGENTCRAFT_JOB_QUEUE', 'postgres')
+    with pytest.raises(ValueError, match='AGENTCRAFT_BLOB_DIR'):
+        create_blob_store()
+
+    environment.setenv('AGENTCRAFT_BLOB_DIR', str(tmp_path))
+    assert create_blob_store().root_dir == str(tmp_path)
@@ -0,0 +1,75 @@
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+from assistant import fake_backends, persona_engine
+from assistant.cassette import LATENCY_INSTANT, MODE_RECORD, MODE_REPLAY, CassetteMiss, recorded, use_cassette
+from assistant.fake_backends import FakeChatModel
+from assistant.inf_graph_schema import Perspectives
+from assistant.persona_engine import fill_personas
+
+TOPIC = 'Compounds with a similar molecular fingerprint to Ibuprofen'
+
+
+class CountingBackend:
+    """Fake backends behind `recorded`, like the clients of `assistant.services`, counting the calls that reach them."""
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.chat_model = FakeChatModel()
+        self.perspective_model = self.chat_model.with_structured_output(Perspectives)
+        self.invoke = recorded('openai')(self._counted(self.chat_model.invoke))
+        self.invoke_perspective = recorded('openai_perspective')(self._counted(self.perspective_model.invoke))
+
+    def _counted(self, func):
+        def call(*args, **kwargs):
+            self.calls += 1
+            return func(*args, **kwargs)
+
+        return call
+
+
+@pytest.fixture
+def backend(monkeypatch, tmp_path) -> CountingBackend:
+    monkeypatch.setenv('AGENTCRAFT_CASSETTE_DIR', str(tmp_path))
+    monkeypatch.setattr(fake_backends, 'FAKE_LATENCY_SECONDS', 0.0)
+    backend = CountingBackend()
+    monkeypatch.setattr(persona_engine, 'safe_invoke_perspective', backend.invoke_perspective)
+    return backend
+
+
+def research(backend: CountingBackend, topic: str = TOPIC) -> tuple[AIMessage, list]:
+    answer = backend.invoke([HumanMessage(f'Write your section on {topic}')])
+    # Two batches of personas, generated in parallel threads
+    analysts = fill_personas(topic, [], max_analysts=2 * persona_engine.BATCH_SIZE)
+    return answer, analysts
+
+
+def test_record_then_replay(backend):
+    with use_cassette('session/run-001', mode=MODE_RECORD) as cassette:
+        recorded_answer, recorded_analysts = research(backend)
+    assert backend.calls == len(cassette.entries) >= 3
+    assert {entry['kind'] for entry in cassette.entries} == {'openai', 'openai_perspective'}
+
+    backend.calls = 0
+    with use_cassette('session/run-001', mode=MODE_REPLAY, latency=LATENCY_INSTANT):
+        replayed_answer, replayed_analysts = research(backend)
+    assert backend.calls == 0
+    assert replayed_answer.content == recorded_answer.content
+    assert replayed_analysts == recorded_analysts
+
+
+def test_replay_of_an_unrecorded_call_fails(backend):
+    with use_cassette('session/run-001', mode=MODE_RECORD):
+        research(backend)
+
+    backend.calls = 0
+    with use_cassette('session/run-001', mode=MODE_REPLAY, latency=LATENCY_INSTANT):
+        with pytest.raises(CassetteMiss, match='No recorded openai response'):
+            research(backend, topic='Naproxen')
+    assert backend.calls == 0
+
+
+def test_replay_without_cassette_fails(backend):
+    with pytest.raises(FileNotFoundError):
+        with use_cassette('session/never-recorded', mode=MODE_REPLAY):
+            pass
@@ -0,0 +1,62 @@
+import pytest
+
+from assistant.citations import CitationIdConflict, CitationRegistry, strip_sources
+
+
+@pytest.fixture
+def registry() -> CitationRegistry:
+    return CitationRegistry()
+
+
+def test_register_is_stable_and_distinct(registry):
+    first = registry.register('https://example.com/a')
+    assert registry.register('https://example.com/a') == first
+    assert registry.register('https://example.com/a', page='2') != first
+    assert registry.label(first) == 'https://example.com/a'
+
+
+def test_conflicting_label_is_rejected(registry):
+    registry.update({'S0123456789': 'https://example.com/a'})
+    registry.update({'S0123456789': 'https://example.com/a'})
+    with pytest.raises(CitationIdConflict):
+        registry.update({'S0123456789': 'https://example.com/b'})
+
+
+def test_renumber_in_order_of_first_appearance(registry):
+    a, b, c = (registry.register(f'https://example.com/{name}') for name in 'abc')
+    text, sources = registry.renumber(f'First [{b}]. Second [{a}]. Again [{b}]. Third [{c}].')
+    assert text == 'First [1]. Second [2]. Again [1]. Third [3].'
+    assert sources == ['https://example.com/b', 'https://example.com/a', 'https://example.com/c']
+
+
+def test_grouped_citations(registry):
+    a, b = registry.register('https://example.com/a'), registry.register('https://example.com/b')
+    text, sources = registry.renumber(f'Both [{a}, {b}], then [{b}].')
+    assert text == 'Both [1][2], then [2].'
+    assert registry.cited_ids(f'Both [{a}, {b}], then [{b}].') == [a, b]
+
+
+def test_unregistered_ids_are_dropped(registry):
+    a = registry.register('https://example.com/a')
+    text, sources = registry.renumber(f'Known [{a}], unknown [Sdeadbeef00], mixed [Sdeadbeef00, {a}].')
+    assert text == 'Known [1], unknown , mixed [1].'
+    assert sources == ['https://example.com/a']
+    assert registry.cited_ids('Unknown [Sdeadbeef00].') == []
+
+
+def test_links_and_checkboxes_are_untouched(registry):
+    a = registry.register('https://example.com/a')
+    markdown = f'- [ ] todo\n- [x] done\n- see [the docs](https://example.com/docs) and [{a}]'
+    text, _ = registry.renumber(markdown)
+    assert text == '- [ ] todo\n- [x] done\n- see [the docs](https://example.com/docs) and [1]'
+
+
+def test_render_replaces_a_trailing_sources_section(registry):
+    a = registry.register('https://example.com/a')
+    text = f'## Insights\n\nA finding [{a}].\n\n### Sources\n[1] https://made-up.example.com  \n'
+    assert strip_sources(text) == f'## Insights\n\nA finding [{a}].'
+    assert registry.render(text) == '## Insights\n\nA finding [1].\n\n### Sources\n[1] https://example.com/a  '
+
+
+def test_render_without_citations_has_no_sources(registry):
+    assert registry.render('No citations here.\n\n### Sources\n[1] made up') == 'No citations here.'
@@ -0,0 +1,70 @@
+from langchain_core.messages import AIMessage, HumanMessage
+
+from assistant.inf_graph_interview import (EXTEND_INFORMATION_GAIN, LLM_CALLS_PER_TURN, MIN_INFORMATION_GAIN,
+                                           measure_information_gain, route_messages)
+
+DOCUMENT = '<Document id="S1a2b3c4d5e"/>\nIbuprofen is a propionic acid derivative that inhibits cyclooxygenase.\n</Document>'
+
+
+def interview_state(num_turns: int, information_gain: list[float], llm_calls: int = 0, max_num_turns: int = 2,
+                    last_question: str = 'What else should I know?') -> dict:
+    """State after `num_turns` question - answer turns, the last question being `last_question`."""
+    messages = [HumanMessage('So you said you were writing an article on Ibuprofen?')]
+    for turn in range(num_turns):
+        question = last_question if turn == num_turns - 1 else f'Question {turn}?'
+        messages += [AIMessage(question), AIMessage(f'Answer {turn}.', name='expert')]
+    return {
+        'messages': messages,
+        'max_num_turns': max_num_turns,
+        'information_gain': information_gain,
+        'llm_calls': llm_calls,
+    }
+
+
+def test_low_information_gain_ends_the_interview():
+    state = interview_state(num_turns=1, information_gain=[MIN_INFORMATION_GAIN / 2])
+    assert route_messages(state) == 'save_interview'
+
+
+def test_moderate_information_gain_continues_below_max_turns():
+    state = interview_state(num_turns=1, information_gain=[(MIN_INFORMATION_GAIN + EXTEND_INFORMATION_GAIN) / 2])
+    assert route_messages(state) == 'ask_question'
+
+
+def test_max_turns_end_the_interview_unless_the_gain_is_high():
+    state = interview_state(num_turns=2, information_gain=[0.9, (MIN_INFORMATION_GAIN + EXTEND_INFORMATION_GAIN) / 2])
+    assert route_messages(state) == 'save_interview'
+
+
+def test_high_information_gain_extends_past_max_turns():
+    state = interview_state(num_turns=2, information_gain=[0.9, EXTEND_INFORMATION_GAIN + 0.1])
+    assert route_messages(state) == 'ask_question'
+
+
+def test_call_budget_ends_the_interview():
+    max_llm_calls = 10
+    state = interview_state(num_turns=1, information_gain=[0.9], llm_calls=max_llm_calls - LLM_CALLS_PER_TURN)
+    state['max_llm_calls'] = max_llm_calls
+    assert route_messages(state) == 'save_interview'
+
+    # One call fewer leaves room for another turn and the section writer
+    state['llm_calls'] = max_llm_calls - LLM_CALLS_PER_TURN - 1
+    assert route_messages(state) == 'ask_question'
+
+
+def test_thank_you_ends_the_interview():
+    state = interview_state(num_turns=1, information_gain=[0.9], last_question='Thank you so much for your help!')
+    assert route_messages(state) == 'save_interview'
+
+
+def test_refetched_documents_score_near_zero():
+    answer = 'Ibuprofen inhibits cyclooxygenase [S1a2b3c4d5e].'
+    gain = measure_information_gain(new_texts=[DOCUMENT, answer], seen_texts=[DOCUMENT, answer])
+    assert gain < 0.05
+
+
+def test_new_documents_score_high():
+    new_document = ('<Document id="S9f8e7d6c5b"/>\nNaproxen shares the arylpropionic scaffold and a similar '
+                    'molecular fingerprint.\n</Document>')
+    gain = measure_information_gain(new_texts=[new_document], seen_texts=[DOCUMENT])
+    assert gain > 0.8
@@ -0,0 +1,95 @@
+import pytest
+
+from assistant import job_queue as job_queue_module
+from assistant.database import SQLITE, sqlite_connection_factory
+from assistant.job_queue import (JOB_INTERVIEW, JOB_PERSONAS, MAX_JOB_ATTEMPTS, STATUS_DONE, STATUS_FAILED,
+                                 STATUS_QUEUED, STATUS_RUNNING, JobQueue)
+
+
+@pytest.fixture
+def queue(tmp_path) -> JobQueue:
+    return JobQueue(sqlite_connection_factory(str(tmp_path / 'jobs.sqlite3')), SQLITE)
+
+
+@pytest.fixture
+def expired_leases(monkeypatch):
+    """Every running job has an expired lease."""
+    monkeypatch.setattr(job_queue_module, 'JOB_LEASE_SECONDS', -1)
+
+
+def test_enqueue_claim_complete(queue):
+    job_id = queue.enqueue(JOB_PERSONAS, {'topic': 'Ibuprofen', 'max_analysts': 3})
+    assert queue.get(job_id).status == STATUS_QUEUED
+
+    job = queue.claim('worker-1')
+    assert (job.job_id, job.kind, job.payload) == (job_id, JOB_PERSONAS, {'topic': 'Ibuprofen', 'max_analysts': 3})
+    assert queue.get(job_id).status == STATUS_RUNNING
+
+    assert queue.complete(job_id, 'worker-1', {'analysts': []})
+    job = queue.get(job_id)
+    assert (job.status, job.result) == (STATUS_DONE, {'analysts': []})
+
+
+def test_jobs_are_claimed_in_order(queue):
+    first = queue.enqueue(JOB_PERSONAS, {})
+    second = queue.enqueue(JOB_INTERVIEW, {})
+    assert queue.claim('worker-1').job_id == first
+    assert queue.claim('worker-2').job_id == second
+
+
+def test_leased_job_is_not_claimed_twice(queue):
+    queue.enqueue(JOB_PERSONAS, {})
+    assert queue.claim('worker-1') is not None
+    assert queue.claim('worker-2') is None
+
+
+def test_expired_lease_is_reclaimed(queue, expired_leases):
+    job_id = queue.enqueue(JOB_PERSONAS, {})
+    queue.claim('worker-1')
+    assert queue.claim('worker-2').job_id == job_id
+
+    # The worker that lost the lease can neither publish nor finish the job
+    assert not queue.publish(job_id, 'worker-1', {'node': 'create_analysts'})
+    assert not queue.complete(job_id, 'worker-1', {'analysts': []})
+    assert not queue.fail(job_id, 'worker-1', 'Traceback')
+    assert not queue.heartbeat(job_id, 'worker-1')
+    assert queue.events(job_id) == []
+
+    assert queue.heartbeat(job_id, 'worker-2')
+    assert queue.fail(job_id, 'worker-2', 'Traceback')
+    assert queue.get(job_id).status == STATUS_FAILED
+
+
+def test_job_fails_after_max_attempts(queue, expired_leases):
+    job_id = queue.enqueue(JOB_PERSONAS, {})
+    for attempt in range(MAX_JOB_ATTEMPTS):
+        assert queue.claim(f'worker-{attempt}').job_id == job_id
+    assert queue.claim('worker-last') is None
+    job = queue.get(job_id)
+    assert job.status == STATUS_FAILED
+    assert 'attempts' in job.error
+
+
+def test_failed_job_keeps_its_usage(queue):
+    job_id = queue.enqueue(JOB_INTERVIEW, {})
+    queue.claim('worker-1')
+    usage = {'input_tokens': 1200, 'output_tokens': 300, 'cached_tokens': 0, 'cost': 0.0004}
+    assert queue.fail(job_id, 'worker-1', 'Traceback', {'usage': usage})
+    job = queue.get(job_id)
+    assert (job.status, job.error, job.result) == (STATUS_FAILED, 'Traceback', {'usage': usage})
+
+
+def test_events_after_event_id(queue):
+    job_id = queue.enqueue(JOB_INTERVIEW, {})
+    other_job_id = queue.enqueue(JOB_INTERVIEW, {})
+    queue.claim('worker-1')
+    queue.claim('worker-2')
+
+    for turn in range(1, 4):
+        assert queue.publish(job_id, 'worker-1', {'turn': turn})
+    queue.publish(other_job_id, 'worker-2', {'turn': 1})
+
+    events = queue.events(job_id)
+    assert [event for _, event in events] == [{'turn': 1}, {'turn': 2}, {'turn': 3}]
+    assert [event for _, event in queue.events(job_id, after_event_id=events[0][0])] == [{'turn': 2}, {'turn': 3}]
+    assert queue.events(job_id, after_event_id=events[-1][0]) == []
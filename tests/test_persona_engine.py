@@ -0,0 +1,109 @@
+import itertools
+import re
+import threading
+
+import pytest
+
+from assistant import persona_engine
+from assistant.inf_graph_schema import Analyst, Perspectives
+from assistant.persona_engine import (MAX_REGENERATION_ROUNDS, affected_personas, dedupe_personas, fill_personas,
+                                      refine_personas)
+
+TOPIC = 'Compounds with a similar molecular fingerprint to Ibuprofen'
+FOCUSES = [
+    ('Medicinal Chemist', 'synthesis routes scaffold hopping and structure activity relationships'),
+    ('Clinical Pharmacologist', 'dosage tolerability trials and patient outcomes in hospitals'),
+    ('Regulatory Specialist', 'approval pathways labelling obligations and agency guidance'),
+    ('Market Analyst', 'pricing competition generics revenue and pharmacy distribution'),
+    ('Data Scientist', 'fingerprint similarity metrics embeddings and benchmark datasets'),
+    ('Toxicologist', 'liver injury gastrointestinal bleeding and safety signals'),
+]
+
+
+def analyst(i: int, name: str = None) -> Analyst:
+    role, description = FOCUSES[i]
+    return Analyst(affiliation='Institute', name=name or f'Dr. Analyst{i}', role=role, description=description)
+
+
+class StubPerspectives:
+    """Stand-in of `safe_invoke_perspective`: hands out the scripted personas and records the requests."""
+
+    def __init__(self, personas: list[Analyst]) -> None:
+        self.personas = itertools.cycle(personas)
+        self.requested: list[int] = list()
+        self.refined: list[str] = list()
+        self._lock = threading.Lock()
+
+    def __call__(self, messages: list) -> Perspectives:
+        task = messages[-1].content
+        with self._lock:
+            if task.startswith('Refine this Analyst Persona'):
+                name = re.search(r'Name: (.+)', task).group(1)
+                self.refined.append(name)
+                refined = next(a for a in self.originals if a.name == name)
+                return Perspectives(analysts=[refined.model_copy(update={'affiliation': 'Refined Institute'})])
+
+            count = int(re.search(r'set of (\d+) Analyst Personas', task).group(1))
+            self.requested.append(count)
+            return Perspectives(analysts=[next(self.personas) for _ in range(count)])
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    def install(personas: list[Analyst], originals: list[Analyst] = ()) -> StubPerspectives:
+        perspectives = StubPerspectives(personas)
+        perspectives.originals = list(originals)
+        monkeypatch.setattr(persona_engine, 'safe_invoke_perspective', perspectives)
+        return perspectives
+
+    return install
+
+
+def test_dedupe_drops_duplicates_by_name():
+    analysts = [analyst(0), analyst(1, name='Dr. Analyst0')]
+    assert dedupe_personas(analysts) == [analyst(0)]
+
+
+def test_dedupe_drops_duplicates_by_role_and_description():
+    duplicate = analyst(0, name='Dr. Someone Else')
+    assert dedupe_personas([analyst(0), duplicate, analyst(1)]) == [analyst(0), analyst(1)]
+
+
+def test_dedupe_against_kept_personas_returns_only_new_ones():
+    assert dedupe_personas([analyst(0, name='Dr. Other'), analyst(2)], keep=[analyst(0), analyst(1)]) == [analyst(2)]
+
+
+def test_fill_regenerates_only_the_freed_slots(stub):
+    perspectives = stub([analyst(3)])
+    analysts = fill_personas(TOPIC, [analyst(0), analyst(1), analyst(0, name='Dr. Copy')], max_analysts=3)
+    assert analysts == [analyst(0), analyst(1), analyst(3)]
+    assert perspectives.requested == [1]
+
+
+def test_fill_stops_after_max_regeneration_rounds(stub):
+    # Every generated persona duplicates the existing one
+    perspectives = stub([analyst(0, name='Dr. Copy')])
+    analysts = fill_personas(TOPIC, [analyst(0)], max_analysts=2)
+    assert analysts == [analyst(0)]
+    assert len(perspectives.requested) == MAX_REGENERATION_ROUNDS + 1
+
+
+def test_feedback_naming_one_persona_refines_only_it(stub):
+    analysts = [analyst(0), analyst(1), analyst(2)]
+    assert affected_personas(analysts, 'Make Analyst1 focus on children.') == [1]
+
+    perspectives = stub([analyst(5)], originals=analysts)
+    refined = refine_personas(TOPIC, analysts, max_analysts=3, human_analyst_feedback='Dr. Analyst1 is too broad.')
+    assert perspectives.refined == ['Dr. Analyst1']
+    assert [a.affiliation for a in refined] == ['Institute', 'Refined Institute', 'Institute']
+    assert perspectives.requested == []
+
+
+def test_feedback_naming_nobody_refines_all(stub):
+    analysts = [analyst(0), analyst(1)]
+    assert affected_personas(analysts, 'Focus more on children.') == [0, 1]
+
+    perspectives = stub([analyst(5)], originals=analysts)
+    refined = refine_personas(TOPIC, analysts, max_analysts=2, human_analyst_feedback='Focus more on children.')
+    assert sorted(perspectives.refined) == ['Dr. Analyst0', 'Dr. Analyst1']
+    assert [a.affiliation for a in refined] == ['Refined Institute', 'Refined Institute']
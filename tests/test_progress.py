@@ -0,0 +1,117 @@
+import threading
+import time
+from typing import TypedDict
+
+import pytest
+from langgraph.graph import END, START, StateGraph
+
+from assistant.progress import (STATUS_DONE, STATUS_END, STATUS_ERROR, STATUS_START, ProgressBus, ProgressEvent,
+                                stream_graph)
+
+MIN_INTERVAL_SECONDS = 0.2
+
+
+class Deliveries:
+    """Subscriber recording the delivered batches of events."""
+
+    def __init__(self) -> None:
+        self.batches: list[list[ProgressEvent]] = list()
+        self.delivered = threading.Event()
+
+    def __call__(self, events: list[ProgressEvent]) -> None:
+        self.batches.append(events)
+        self.delivered.set()
+
+
+@pytest.fixture
+def bus() -> ProgressBus:
+    return ProgressBus(min_interval=MIN_INTERVAL_SECONDS)
+
+
+@pytest.fixture
+def deliveries(bus) -> Deliveries:
+    deliveries = Deliveries()
+    bus.subscribe(deliveries)
+    return deliveries
+
+
+def event(node: str, status: str = STATUS_START, elapsed: float = 0.0) -> ProgressEvent:
+    return ProgressEvent(graph='interview', node=node, status=status, elapsed=elapsed)
+
+
+def test_held_back_events_arrive_without_a_further_publish(bus, deliveries):
+    bus.publish(event('ask_question'))
+    assert len(deliveries.batches) == 1
+
+    deliveries.delivered.clear()
+    bus.publish(event('ask_question', STATUS_END))
+    assert len(deliveries.batches) == 1
+
+    assert deliveries.delivered.wait(timeout=10 * MIN_INTERVAL_SECONDS)
+    assert [e.status for e in deliveries.batches[1]] == [STATUS_END]
+
+
+def test_only_the_latest_event_of_a_node_is_delivered(bus, deliveries):
+    bus.publish(event('ask_question'))
+    bus.publish(event('ask_question', STATUS_END, elapsed=1.0))
+    bus.publish(event('search_web', elapsed=1.0))
+    bus.publish(event('search_web', STATUS_END, elapsed=2.0))
+    bus.publish(event('ask_question', elapsed=2.0))
+    bus.flush()
+
+    assert [(e.node, e.status, e.elapsed) for e in deliveries.batches[-1]] == [
+        ('search_web', STATUS_END, 2.0),
+        ('ask_question', STATUS_START, 2.0),
+    ]
+
+
+def test_done_event_is_delivered_immediately(bus, deliveries):
+    bus.publish(event('ask_question'))
+    bus.publish(event('ask_question', STATUS_END))
+    bus.publish(event('', STATUS_DONE))
+
+    assert [(e.node, e.status) for e in deliveries.batches[-1]] == [('ask_question', STATUS_END), ('', STATUS_DONE)]
+    # Nothing is left for the timer to deliver
+    time.sleep(2 * MIN_INTERVAL_SECONDS)
+    assert len(deliveries.batches) == 2
+
+
+class State(TypedDict):
+    count: int
+
+
+def count(state: State) -> State:
+    return {'count': state['count'] + 1}
+
+
+def fail(state: State) -> State:
+    raise RuntimeError('Search backend unavailable')
+
+
+def build_graph(second_node) -> StateGraph:
+    builder = StateGraph(State)
+    builder.add_node('count', count)
+    builder.add_node('second', second_node)
+    builder.add_edge(START, 'count')
+    builder.add_edge('count', 'second')
+    builder.add_edge('second', END)
+    return builder.compile()
+
+
+def test_stream_graph_closes_the_run_with_done(bus, deliveries):
+    values = stream_graph(build_graph(count), {'count': 0}, {}, bus, 'counter')
+    assert values == {'count': 2}
+
+    events = [e for batch in deliveries.batches for e in batch]
+    assert events[-1].status == STATUS_DONE
+    assert ('second', STATUS_END) in [(e.node, e.status) for e in events]
+
+
+def test_stream_graph_of_a_failing_graph_closes_the_run_with_error(bus, deliveries):
+    with pytest.raises(RuntimeError, match='Search backend unavailable'):
+        stream_graph(build_graph(fail), {'count': 0}, {}, bus, 'counter')
+
+    # Delivered right away, rather than by the timer after the graph has gone
+    last = deliveries.batches[-1][-1]
+    assert (last.node, last.status) == ('', STATUS_ERROR)
+    assert last.describe().startswith('`counter` failed after')
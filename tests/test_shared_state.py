@@ -0,0 +1,56 @@
+import time
+
+import pytest
+
+from assistant.database import SQLITE, sqlite_connection_factory
+from assistant.shared_state import SharedStore
+
+PERIOD_SECONDS = 0.5
+
+
+@pytest.fixture
+def stores(tmp_path) -> tuple[SharedStore, SharedStore]:
+    """Two stores on the same file, like two serving processes sharing the state."""
+    fqfp_db = str(tmp_path / 'shared_state.sqlite3')
+    return tuple(SharedStore(sqlite_connection_factory(fqfp_db), SQLITE) for _ in range(2))
+
+
+def test_stores_share_one_window(stores):
+    first, second = stores
+    assert first.acquire('search', limit=3, period=60) == 0
+    assert second.acquire('search', limit=3, period=60) == 0
+    assert first.acquire('search', limit=3, period=60) == 0
+
+    # The window of both stores is full, while other limiters are not affected
+    assert 0 < second.acquire('search', limit=3, period=60) <= 60
+    assert 0 < first.acquire('search', limit=3, period=60) <= 60
+    assert second.acquire('llm', limit=3, period=60) == 0
+
+
+def test_weighted_call_over_the_limit_waits_for_the_window(stores):
+    first, second = stores
+    assert first.acquire('tokens', limit=100, period=PERIOD_SECONDS, weight=80) == 0
+
+    wait = second.acquire('tokens', limit=100, period=PERIOD_SECONDS, weight=30)
+    assert 0 < wait <= PERIOD_SECONDS
+    time.sleep(wait)
+    assert second.acquire('tokens', limit=100, period=PERIOD_SECONDS, weight=30) == 0
+    assert first.acquire('tokens', limit=100, period=PERIOD_SECONDS, weight=80) > 0
+
+
+def test_refused_calls_are_not_recorded(stores):
+    first, second = stores
+    assert first.acquire('search', limit=1, period=PERIOD_SECONDS) == 0
+    for _ in range(5):
+        assert second.acquire('search', limit=1, period=PERIOD_SECONDS) > 0
+
+    time.sleep(PERIOD_SECONDS)
+    assert second.acquire('search', limit=1, period=PERIOD_SECONDS) == 0
+
+
+def test_put_keeps_the_first_value(stores):
+    first, second = stores
+    assert first.put('citations', 'S0123456789', 'https://example.com/a') == 'https://example.com/a'
+    assert second.put('citations', 'S0123456789', 'https://example.com/b') == 'https://example.com/a'
+    assert second.get('citations', 'S0123456789') == 'https://example.com/a'
+    assert first.get('citations', 'unknown') is None
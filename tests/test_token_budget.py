@@ -0,0 +1,41 @@
+import pytest
+import tiktoken
+import tiktoken.load
+import tiktoken.registry
+from langchain_core.messages import HumanMessage, SystemMessage
+
+from assistant import token_budget
+from assistant.token_budget import CHARS_PER_TOKEN, TokenBudgetExceeded, count_tokens, fit_prompt
+
+
+@pytest.fixture
+def offline(monkeypatch, tmp_path):
+    """No BPE file is cached, and downloading one fails."""
+
+    def read_file(blobpath: str) -> bytes:
+        raise ConnectionError(f'No network to fetch {blobpath}')
+
+    monkeypatch.setenv('TIKTOKEN_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(tiktoken.load, 'read_file', read_file)
+    monkeypatch.setattr(tiktoken.registry, 'ENCODINGS', dict())
+    token_budget._encoding.cache_clear()
+    yield
+    token_budget._encoding.cache_clear()
+
+
+def test_tokens_are_estimated_without_network(offline):
+    with pytest.warns(UserWarning, match='tiktoken is unavailable'):
+        num_tokens = count_tokens([SystemMessage('a' * 40), HumanMessage('b' * 41)])
+    # Message and reply framing, plus 10 and 11 estimated tokens
+    assert num_tokens == 3 + (3 + 10) + (3 + 11)
+
+
+def test_prompt_is_trimmed_without_network(offline):
+    messages = [SystemMessage('system'), HumanMessage('x' * 100 * CHARS_PER_TOKEN), HumanMessage('question')]
+    with pytest.warns(UserWarning):
+        trimmed, num_tokens = fit_prompt(messages, max_tokens=50)
+    assert [message.content for message in trimmed] == ['system', 'question']
+    assert num_tokens <= 50
+
+    with pytest.raises(TokenBudgetExceeded):
+        fit_prompt([HumanMessage('x' * 100 * CHARS_PER_TOKEN)], max_tokens=50)